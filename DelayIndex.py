@@ -0,0 +1,75 @@
+"""
+An index answering Player.delay_message without scanning ACK and DEAL.
+A message from a sender is delayed if some invocation which has already ended still has an ACK or DEAL entry for the
+sender, and that invocation ended before the invocation of the message began. So it is enough to know, for every
+sender, the earliest end of an invocation with outstanding entries for it.
+Player calls add and remove wherever it adds or removes an ACK or DEAL entry, and ended whenever an invocation ends.
+"""
+
+
+class DelayIndex:
+    """
+    Counts the outstanding ACK and DEAL entries of every (tag, sender) pair, and keeps the earliest end time of an
+    invocation with entries for every sender. The earliest end of a sender is recomputed lazily, only after something
+    relevant to it has changed.
+    """
+    def __init__(self, invocations):
+        self.invocations = invocations  # {tag: [begin_time, end_time]}. The invocations of the player.
+        self.by_tag = {}  # {tag: {sender: count}}. The number of outstanding entries.
+        self.by_sender = {}  # {sender: {tag: count}}. The same counts, indexed by the sender.
+        self.earliest = {}  # {sender: (end_time, tag) or None}. The earliest ending invocation with entries.
+
+    def add(self, tag, sender):
+        senders = self.by_tag.setdefault(tag, {})
+        senders[sender] = senders.get(sender, 0) + 1
+        tags = self.by_sender.setdefault(sender, {})
+        tags[tag] = tags.get(tag, 0) + 1
+        self.earliest.pop(sender, None)
+
+    def remove(self, tag, sender):
+        senders = self.by_tag[tag]
+        senders[sender] -= 1
+        if not senders[sender]:
+            senders.pop(sender)
+            if not senders:
+                self.by_tag.pop(tag)
+        tags = self.by_sender[sender]
+        tags[tag] -= 1
+        if not tags[tag]:
+            tags.pop(tag)
+            if not tags:
+                self.by_sender.pop(sender)
+        self.earliest.pop(sender, None)
+
+    def ended(self, tag):
+        """ This function is to be called after the end time of an invocation has changed. """
+        for sender in self.by_tag.get(tag, ()):
+            self.earliest.pop(sender, None)
+
+    def earliest_end(self, sender):
+        """
+        Returns (end_time, tag) for the invocation which ended first out of those with outstanding entries for the
+        sender, or None if there is no such invocation.
+        """
+        if sender in self.earliest:
+            return self.earliest[sender]
+
+        result = None
+        for tag in self.by_sender.get(sender, ()):
+            times = self.invocations.get(tag)
+            if times is not None and times[1] is not None and (result is None or times[1] < result[0]):
+                result = (times[1], tag)
+
+        self.earliest[sender] = result
+        return result
+
+    def ended_after(self, sender, time):
+        """
+        Returns the tag of an invocation with outstanding entries for the sender which ended after time, or None if
+        there is no such invocation.
+        """
+        for tag in self.by_sender.get(sender, ()):
+            times = self.invocations.get(tag)
+            if times is not None and times[1] is not None and times[1] > time:
+                return tag
+        return None
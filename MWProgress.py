@@ -0,0 +1,55 @@
+"""
+Tracks the dependencies of an MW-Share invocation, so that checking whether it's done doesn't walk M and the L sets.
+The invocation is done (for the dealer, ready to send OK) once M has been received, every processor in M has sent an L
+set, and every processor in those L sets has sent an ack. Instead of checking this after every message, the number of
+missing L sets and acks is counted, and every message only updates the counts it affects.
+The sets themselves stay in the player's MW_ack, MW_L and MW_M, which are passed to the functions which need them.
+"""
+
+
+class MWProgress:
+    def __init__(self):
+        self.pending = {}  # {processor: count}. The number of processors in its L set who haven't sent acks.
+        self.waiting = {}  # {processor: [processor1, ...]}. The processors with L sets waiting for its ack.
+        self.missing = None  # The number of missing L sets and acks for the processors in M, once M is received.
+
+    def missing_for(self, j, L):
+        """ Returns the number of messages missing for the L set of j, given the received L sets. """
+        return self.pending[j] if j in L else 1
+
+    def ack(self, sender, M):
+        """ This function is to be called after receiving the first ack of the sender. M is the M set or None. """
+        for j in self.waiting.pop(sender, ()):
+            self.pending[j] -= 1
+            if M is not None and j in M:
+                self.missing -= 1
+
+    def set_L(self, sender, old, L, acked, M):
+        """
+        This function is to be called after receiving an L message.
+        old is the L set the sender had before (None if it hadn't sent one), acked is the set of processors who've sent
+        acks and M is the M set or None.
+        """
+        before = 1 if old is None else self.pending[sender]
+        if old is not None:
+            # Only one L message is expected from every processor, but a new one replaces the old one.
+            for l in set(old):
+                if l not in acked:
+                    self.waiting[l].remove(sender)
+
+        self.pending[sender] = 0
+        for l in set(L):
+            if l not in acked:
+                self.waiting.setdefault(l, []).append(sender)
+                self.pending[sender] += 1
+
+        if M is not None and sender in M:
+            self.missing += self.pending[sender] - before
+
+    def set_M(self, M, L):
+        """ This function is to be called after receiving an M message. L is {processor: L set}, the received L sets. """
+        self.missing = sum(self.missing_for(j, L) for j in set(M))
+
+    def done(self):
+        """ Returns True if M, and the L sets and acks it depends on, have all been received. """
+        return self.missing == 0
@@ -0,0 +1,251 @@
+"""
+Fast polynomial arithmetic over the NTT-friendly prime 998244353 = 119 * 2^23 + 1.
+Polynomials here are plain lists of coefficients, ordered from the free coefficient upwards like Polynomial.coef.
+Multiplication uses the number theoretic transform, and multipoint evaluation and interpolation use a subproduct tree,
+so that both take O(n log^2 n) instead of O(n^2).
+Polynomial switches to these functions by itself for large inputs over NTT_PRIME, so they rarely need to be called
+directly.
+"""
+from functools import lru_cache
+from operator import add
+
+NTT_PRIME = 998244353
+GENERATOR = 3
+# Products where one of the factors is shorter than this are computed with the schoolbook algorithm.
+NAIVE_MULTIPLY_SIZE = 48
+# Subtrees with at most this many points are evaluated and interpolated directly.
+NAIVE_TREE_SIZE = 32
+# The number of distinct point sets for which the subproduct tree is kept.
+TREE_CACHE_SIZE = 16
+
+
+@lru_cache(maxsize=None)
+def bit_reversal(n):
+    """ Returns the bit reversal permutation of range(n), for n a power of 2. """
+    rev = [0] * n
+    bits = n.bit_length() - 1
+    for i in range(1, n):
+        rev[i] = (rev[i >> 1] >> 1) | ((i & 1) << (bits - 1))
+    return rev
+
+
+@lru_cache(maxsize=None)
+def roots(length, invert):
+    """ Returns the first length/2 powers of a primitive length-th root of unity (or of its inverse). """
+    w = pow(GENERATOR, (NTT_PRIME - 1) // length, NTT_PRIME)
+    if invert:
+        w = pow(w, NTT_PRIME - 2, NTT_PRIME)
+    powers = [1] * (length // 2)
+    for i in range(1, length // 2):
+        powers[i] = powers[i - 1] * w % NTT_PRIME
+    return powers
+
+
+def ntt(a, invert=False):
+    """ Returns the transform of a, whose length must be a power of 2 dividing 2^23. """
+    p = NTT_PRIME
+    n = len(a)
+    a = [a[i] for i in bit_reversal(n)]
+
+    length = 2
+    while length <= n:
+        half = length // 2
+        ws = roots(length, invert)
+        if half >= n // length:
+            # Few long blocks: handle each block with slices.
+            for start in range(0, n, length):
+                lo = a[start:start + half]
+                hi = [x * w % p for x, w in zip(a[start + half:start + length], ws)]
+                a[start:start + half] = [(u + v) % p for u, v in zip(lo, hi)]
+                a[start + half:start + length] = [(u - v) % p for u, v in zip(lo, hi)]
+        else:
+            # Many short blocks: handle the k-th element of all of the blocks at once with strided slices.
+            for k in range(half):
+                w = ws[k]
+                lo = a[k::length]
+                hi = [x * w % p for x in a[k + half::length]]
+                a[k::length] = [(u + v) % p for u, v in zip(lo, hi)]
+                a[k + half::length] = [(u - v) % p for u, v in zip(lo, hi)]
+        length *= 2
+
+    if invert:
+        inv_n = pow(n, p - 2, p)
+        a = [x * inv_n % p for x in a]
+
+    return a
+
+
+def trim(a):
+    """ Removes the zero coefficients of the highest degrees, keeping at least one coefficient. """
+    end = len(a)
+    while end > 1 and a[end - 1] == 0:
+        end -= 1
+    return a[:end]
+
+
+def multiply(a, b):
+    """ Returns the product of a and b. """
+    if not a or not b:
+        return []
+
+    p = NTT_PRIME
+    if min(len(a), len(b)) < NAIVE_MULTIPLY_SIZE:
+        if len(a) < len(b):
+            a, b = b, a
+        width = len(a)
+        res = [0] * (len(a) + len(b) - 1)
+        for i, c in enumerate(b):
+            if c:
+                res[i:i + width] = map(add, res[i:i + width], [c * d for d in a])
+        return [c % p for c in res]
+
+    length = len(a) + len(b) - 1
+    size = 1
+    while size < length:
+        size *= 2
+
+    fa = ntt(list(a) + [0] * (size - len(a)))
+    fb = ntt(list(b) + [0] * (size - len(b)))
+    return ntt([x * y % p for x, y in zip(fa, fb)], True)[:length]
+
+
+def inverse_series(a, k):
+    """ Returns b such that a * b = 1 modulo x^k, using Newton iteration. a[0] must be invertible. """
+    p = NTT_PRIME
+    b = [pow(a[0], p - 2, p)]
+    m = 1
+    while m < k:
+        m *= 2
+        error = multiply(a[:m], b)[:m]
+        error = [-c % p for c in error]
+        error[0] = (error[0] + 2) % p
+        b = multiply(b, error)[:m]
+    return b[:k]
+
+
+def remainder(a, b, reversed_inverse=None):
+    """
+    Returns a modulo b.
+    reversed_inverse can be an inverse series of reversed(b) which is long enough, in order not to recompute it.
+    """
+    p = NTT_PRIME
+    n = len(a) - 1
+    m = len(b) - 1
+    if n < m:
+        return list(a)
+
+    if m < NAIVE_MULTIPLY_SIZE or n - m < NAIVE_MULTIPLY_SIZE:
+        r = list(a)
+        inv_lead = pow(b[-1], p - 2, p)
+        for i in range(n - m, -1, -1):
+            c = r[i + m] * inv_lead % p
+            if c:
+                r[i:i + m + 1] = [(x - c * y) % p for x, y in zip(r[i:i + m + 1], b)]
+        return r[:m]
+
+    k = n - m + 1
+    if reversed_inverse is None or len(reversed_inverse) < k:
+        reversed_inverse = inverse_series(b[::-1], k)
+    quotient = multiply(a[::-1][:k], reversed_inverse[:k])[:k][::-1]
+    product = multiply(quotient, b)
+    return [(x - y) % p for x, y in zip(a[:m], product[:m])]
+
+
+def evaluate_directly(coef, xs):
+    """ Evaluates coef at every point of xs with Horner's rule. """
+    p = NTT_PRIME
+    res = []
+    for x in xs:
+        total = 0
+        for c in reversed(coef):
+            total = (total * x + c) % p
+        res.append(total)
+    return res
+
+
+class SubproductTree:
+    """
+    A node of the subproduct tree of a sequence of points.
+    poly is the product of (x - x_i) over the points of the node, and the children split the points in half.
+    Nodes with at most NAIVE_TREE_SIZE points are leaves.
+    """
+    __slots__ = ("xs", "poly", "left", "right", "reversed_inverse")
+
+    def __init__(self, xs):
+        self.xs = xs
+        self.reversed_inverse = None
+        if len(xs) <= NAIVE_TREE_SIZE:
+            self.left = self.right = None
+            poly = [1]
+            for x in xs:
+                poly = multiply(poly, [-x % NTT_PRIME, 1])
+            self.poly = poly
+        else:
+            mid = len(xs) // 2
+            self.left = SubproductTree(xs[:mid])
+            self.right = SubproductTree(xs[mid:])
+            self.poly = multiply(self.left.poly, self.right.poly)
+
+    def reduce(self, coef):
+        """ Returns coef modulo the polynomial of this node. """
+        if len(coef) < len(self.poly):
+            return coef
+        if self.reversed_inverse is None:
+            # Remainders coming from the parent have degree less than twice the degree of this node.
+            self.reversed_inverse = inverse_series(self.poly[::-1], len(self.poly))
+        return remainder(coef, self.poly, self.reversed_inverse)
+
+    def evaluate(self, coef):
+        """ Returns the values of coef at the points of this node. """
+        coef = self.reduce(coef)
+        if self.left is None:
+            return evaluate_directly(coef, self.xs)
+        return self.left.evaluate(coef) + self.right.evaluate(coef)
+
+    def combine(self, weights):
+        """ Returns the sum of weights[i] * poly / (x - xs[i]). """
+        p = NTT_PRIME
+        if self.left is None:
+            k = len(self.xs)
+            res = [0] * k
+            for x, w in zip(self.xs, weights):
+                if not w:
+                    continue
+                # Synthetic division of poly by (x - x_i).
+                carry = 0
+                for j in range(k, 0, -1):
+                    carry = (self.poly[j] + carry * x) % p
+                    res[j - 1] += w * carry
+            return [c % p for c in res]
+
+        mid = len(self.left.xs)
+        left = multiply(self.left.combine(weights[:mid]), self.right.poly)
+        right = multiply(self.right.combine(weights[mid:]), self.left.poly)
+        if len(left) < len(right):
+            left, right = right, left
+        left[:len(right)] = map(add, left[:len(right)], right)
+        return [c % p for c in left]
+
+
+@lru_cache(maxsize=TREE_CACHE_SIZE)
+def subproduct_tree(xs):
+    return SubproductTree(xs)
+
+
+def multipoint_evaluate(coef, xs):
+    """ Returns the values of coef at every point of xs, in O(n log^2 n). """
+    xs = tuple(x % NTT_PRIME for x in xs)
+    if not xs:
+        return []
+    return subproduct_tree(xs).evaluate(list(coef))
+
+
+def interpolate(xs, ys):
+    """ Returns the coefficients of the polynomial of degree less than len(xs) through the points, in O(n log^2 n). """
+    p = NTT_PRIME
+    xs = tuple(x % p for x in xs)
+    tree = subproduct_tree(xs)
+
+    derivative = [i * c % p for i, c in enumerate(tree.poly)][1:]
+    weights = [y * pow(d, p - 2, p) % p for y, d in zip(ys, tree.evaluate(derivative))]
+    return trim(tree.combine(weights))
@@ -0,0 +1,480 @@
+"""
+Runs players over real sockets on localhost instead of in a simulator.
+Every player is hosted by a Node, which plays the part of the simulator for it (send, RB and time) and listens on its
+own TCP (or Unix) socket. All of the nodes of a Cluster run as tasks of one asyncio event loop.
+Messages are serialized with a small tagged binary codec, and RB is implemented with a simple quorum protocol: a node
+echoes an RB message once its player would process messages from the sender, and delivers it after n-t echoes.
+Every connection starts with a HELLO frame naming the connecting node, and the senders of all of the later frames on the
+connection are taken from it, not from their contents, so a node can't send messages or echoes in the name of another.
+Run from the command line with `python Network.py n t [--runs R] [--prime P] [--unix]` to measure the latency and the
+throughput of SVSS-Share and SVSS-Reconstruct.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import random
+import struct
+import sys
+import tempfile
+from argparse import ArgumentParser
+from fractions import Fraction
+from time import perf_counter
+
+from Message import Message, PolyTag, Stage
+from Player import Player
+from Polynomial import Polynomial, get_rng
+from ProcessorSet import ProcessorSet
+
+# Frame kinds.
+MESSAGE = 0
+RB_INIT = 1
+RB_ECHO = 2
+HELLO = 3
+
+HEADER = struct.Struct("<IB")  # The length of the body and the kind of a frame.
+COUNT = struct.Struct("<I")
+INT_LENGTH = struct.Struct("<H")
+FLOAT = struct.Struct("<d")
+
+ENUMS = {b"E": Stage, b"G": PolyTag}
+
+logger = logging.getLogger(__name__)
+
+
+def encode(obj):
+    """ Returns the serialization of obj, which may contain messages, polynomials, enums and the builtin types. """
+    parts = []
+    encode_into(obj, parts)
+    return b"".join(parts)
+
+
+def encode_into(obj, parts):
+    if obj is None:
+        parts.append(b"N")
+    elif obj is True:
+        parts.append(b"T")
+    elif obj is False:
+        parts.append(b"F")
+    elif isinstance(obj, int) and not isinstance(obj, (Stage, PolyTag)):
+        data = obj.to_bytes(obj.bit_length() // 8 + 1, "little", signed=True)
+        parts += [b"i", INT_LENGTH.pack(len(data)), data]
+    elif isinstance(obj, Stage):
+        parts += [b"E", bytes([obj.value])]
+    elif isinstance(obj, PolyTag):
+        parts += [b"G", bytes([obj.value])]
+    elif isinstance(obj, float):
+        parts += [b"f", FLOAT.pack(obj)]
+    elif isinstance(obj, Fraction):
+        parts.append(b"q")
+        encode_into(obj.numerator, parts)
+        encode_into(obj.denominator, parts)
+    elif isinstance(obj, bytes):
+        parts += [b"b", COUNT.pack(len(obj)), obj]
+    elif isinstance(obj, str):
+        data = obj.encode()
+        parts += [b"s", COUNT.pack(len(data)), data]
+    elif isinstance(obj, Polynomial):
+        parts.append(b"P")
+        encode_into(obj.prime, parts)
+        encode_into(obj.coef, parts)
+    elif isinstance(obj, ProcessorSet):
+        parts.append(b"B")
+        encode_into(obj.bits, parts)
+    elif isinstance(obj, Message):
+        parts.append(b"M")
+        for field in (obj.content, obj.tag, obj.sender, obj.stage, obj.moderator, obj.RB):
+            encode_into(field, parts)
+    elif isinstance(obj, dict):
+        parts += [b"d", COUNT.pack(len(obj))]
+        for key, value in obj.items():
+            encode_into(key, parts)
+            encode_into(value, parts)
+    else:
+        for kind, container in ((b"t", tuple), (b"l", list), (b"S", set), (b"z", frozenset)):
+            if isinstance(obj, container):
+                parts += [kind, COUNT.pack(len(obj))]
+                for item in obj:
+                    encode_into(item, parts)
+                return
+        raise TypeError("can't encode " + type(obj).__name__)
+
+
+def decode(data):
+    """ Returns the object serialized in data. """
+    obj, position = decode_from(memoryview(data), 0)
+    if position != len(data):
+        raise ValueError("trailing data after the encoded object")
+    return obj
+
+
+def decode_from(data, position):
+    """ Returns the object starting at position, and the position after it. """
+    kind = bytes(data[position:position + 1])
+    position += 1
+
+    if kind == b"N":
+        return None, position
+    if kind == b"T":
+        return True, position
+    if kind == b"F":
+        return False, position
+    if kind == b"i":
+        length, = INT_LENGTH.unpack_from(data, position)
+        position += INT_LENGTH.size
+        return int.from_bytes(data[position:position + length], "little", signed=True), position + length
+    if kind in ENUMS:
+        return ENUMS[kind](data[position]), position + 1
+    if kind == b"f":
+        return FLOAT.unpack_from(data, position)[0], position + FLOAT.size
+    if kind == b"q":
+        numerator, position = decode_from(data, position)
+        denominator, position = decode_from(data, position)
+        return Fraction(numerator, denominator), position
+    if kind in (b"b", b"s"):
+        length, = COUNT.unpack_from(data, position)
+        position += COUNT.size
+        value = bytes(data[position:position + length])
+        return (value if kind == b"b" else value.decode()), position + length
+    if kind == b"P":
+        prime, position = decode_from(data, position)
+        coef, position = decode_from(data, position)
+        return Polynomial(coef, prime), position
+    if kind == b"B":
+        bits, position = decode_from(data, position)
+        return ProcessorSet.from_bits(bits), position
+    if kind == b"M":
+        fields = []
+        for i in range(6):
+            field, position = decode_from(data, position)
+            fields.append(field)
+        return Message(*fields), position
+    if kind == b"d":
+        count, = COUNT.unpack_from(data, position)
+        position += COUNT.size
+        result = {}
+        for i in range(count):
+            key, position = decode_from(data, position)
+            result[key], position = decode_from(data, position)
+        return result, position
+    if kind in (b"t", b"l", b"S", b"z"):
+        count, = COUNT.unpack_from(data, position)
+        position += COUNT.size
+        items = []
+        for i in range(count):
+            item, position = decode_from(data, position)
+            items.append(item)
+        return {b"t": tuple, b"l": list, b"S": set, b"z": frozenset}[kind](items), position
+
+    raise ValueError("unknown type " + repr(kind))
+
+
+class Node:
+    """
+    Hosts a single player and connects it to the other nodes.
+    To the player, the node looks like a simulator: it sends messages over the sockets, runs the RB protocol and its
+    time is the number of messages delivered so far.
+    """
+    def __init__(self, id, n, t, prime=None, rng=None, player_class=Player):
+        self.id = id
+        self.n = n
+        self.t = t
+        self.prime = prime
+        self.rng = get_rng(rng)
+        self.inner_time = 0
+        self.writers = {}  # {node id: StreamWriter}. The connections to the nodes, including this one.
+        self.server = None
+        self.address = None  # (host, port) or the path of the Unix socket.
+        self.incoming = 0  # The number of open incoming connections.
+        self.disconnected = asyncio.Event()  # Set when all of the incoming connections have been closed.
+
+        self.rb_serial = 0  # The number of RB messages started by this node.
+        self.rb_messages = {}  # {(origin, serial): (message, digest)}. RB messages which haven't been delivered yet.
+        self.rb_echoes = {}  # {(origin, serial): {digest: {node1, ...}}}. The echoes received for every RB message.
+        self.rb_pending = []  # [(origin, serial), ...]. RB messages which the player isn't ready to echo yet.
+        self.rb_delivered = set()  # {(origin, serial), ...}.
+        self.probes = {}  # {sender: message}. Empty messages used for asking the player if it would delay a sender.
+
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.messages_sent = 0  # The number of messages sent or broadcast by the player.
+        self.watch = None  # The SVSS tag whose reconstruction is awaited.
+        self.finished = {}  # {tag: seconds}. When the reconstruction of each watched tag finished.
+        self.done = asyncio.Event()
+        self.error = None  # The exception raised by the player while handling a frame, if any.
+        self.failed = asyncio.Event()  # Set when the player has raised an exception.
+
+        self.player = player_class(self, id, n, t)
+
+    async def listen(self, unix_dir=None):
+        if unix_dir:
+            self.address = os.path.join(unix_dir, str(self.id) + ".sock")
+            self.server = await asyncio.start_unix_server(self.serve, path=self.address)
+        else:
+            self.server = await asyncio.start_server(self.serve, "127.0.0.1", 0)
+            self.address = self.server.sockets[0].getsockname()[:2]
+
+    async def connect(self, nodes):
+        for node in nodes:
+            if isinstance(node.address, str):
+                reader, writer = await asyncio.open_unix_connection(node.address)
+            else:
+                reader, writer = await asyncio.open_connection(*node.address)
+            self.writers[node.id] = writer
+            self.write(node.id, HELLO, self.id)
+
+    async def serve(self, reader, writer):
+        """
+        Handles the frames of a single incoming connection until it's closed. The first frame must be a HELLO frame,
+        which identifies the node on the other end of the connection.
+        """
+        self.incoming += 1
+        self.disconnected.clear()
+        try:
+            peer = None
+            while True:
+                length, kind = HEADER.unpack(await reader.readexactly(HEADER.size))
+                content = decode(await reader.readexactly(length))
+                if peer is None:
+                    if kind != HELLO or content not in range(1, self.n + 1):
+                        writer.close()
+                        return
+                    peer = content
+                else:
+                    self.handle(peer, kind, content)
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            writer.close()
+        except Exception as error:
+            writer.close()
+            self.fail(error)
+        finally:
+            self.incoming -= 1
+            if not self.incoming:
+                self.disconnected.set()
+
+    def write(self, to, kind, obj):
+        body = encode(obj)
+        self.writers[to].write(HEADER.pack(len(body), kind) + body)
+        self.frames_sent += 1
+        self.bytes_sent += HEADER.size + len(body)
+
+    def send(self, message, to):
+        self.messages_sent += 1
+        self.write(to, MESSAGE, message)
+
+    def RB(self, message):
+        self.messages_sent += 1
+        self.rb_serial += 1
+        for node in self.writers:
+            self.write(node, RB_INIT, (self.rb_serial, message))
+
+    def time(self):
+        return self.inner_time
+
+    def handle(self, peer, kind, content):
+        """ Handles a frame received from the node peer. Messages whose sender isn't peer are dropped. """
+        if kind == MESSAGE:
+            if content.sender == peer:
+                self.deliver(content)
+        elif kind == RB_INIT:
+            serial, message = content
+            key = (peer, serial)
+            if message.sender != peer or key in self.rb_delivered or key in self.rb_messages:
+                return
+            self.rb_messages[key] = (message, hashlib.sha256(encode(message)).digest())
+            if not self.try_echo(key):
+                self.rb_pending.append(key)
+            self.try_deliver_RB(key)
+        elif kind == RB_ECHO:
+            origin, serial, digest = content
+            key = (origin, serial)
+            if key in self.rb_delivered:
+                return
+            self.rb_echoes.setdefault(key, {}).setdefault(digest, set()).add(peer)
+            self.try_deliver_RB(key)
+
+    def try_echo(self, key):
+        """ Echoes the RB message if the player wouldn't delay its sender. Returns True iff it did. """
+        message, digest = self.rb_messages[key]
+        sender = message.sender
+        if sender not in self.probes:
+            self.probes[sender] = Message(None, None, sender, None, None, True)
+        if self.player.delay_message(self.probes[sender], message.tag):
+            return False
+        for node in self.writers:
+            self.write(node, RB_ECHO, (key[0], key[1], digest))
+        return True
+
+    def try_deliver_RB(self, key):
+        if key not in self.rb_messages:
+            return
+        message, digest = self.rb_messages[key]
+        if len(self.rb_echoes.get(key, {}).get(digest, ())) >= self.n - self.t:
+            self.rb_messages.pop(key)
+            self.rb_echoes.pop(key)
+            self.rb_delivered.add(key)
+            self.deliver(message)
+
+    def deliver(self, message):
+        self.inner_time += 1
+        self.player.DMM(message)
+
+        # The player's state changed, so it might be willing to echo RB messages it delayed before.
+        if self.rb_pending:
+            pending = self.rb_pending
+            self.rb_pending = []
+            for key in pending:
+                if key in self.rb_messages and not self.try_echo(key):
+                    self.rb_pending.append(key)
+
+    def fail(self, error):
+        """ Records an exception raised by the player, so that the run fails with it instead of timing out. """
+        logger.error("node %d failed", self.id, exc_info=error)
+        if self.error is None:
+            self.error = error
+        self.failed.set()
+
+    def disconnect(self):
+        """ Closes the outgoing connections. """
+        for writer in self.writers.values():
+            writer.close()
+        self.writers = {}
+
+    def SVSS_done(self, player, tag):
+        """ This function is called by the player after it has reconstructed the value of an SVSS invocation. """
+        if tag == self.watch and tag not in self.finished:
+            self.finished[tag] = perf_counter()
+            self.done.set()
+
+    async def close(self):
+        """ Waits for the other nodes to disconnect, and stops listening. """
+        if self.incoming:
+            await self.disconnected.wait()
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+
+class Cluster:
+    """
+    n nodes connected to each other over localhost.
+    player_classes optionally maps node ids to Player subclasses to use instead of Player (for example, faulty ones).
+    If unix is True, Unix sockets in a temporary directory are used instead of TCP.
+    """
+    def __init__(self, n, t, prime=None, seed=None, player_classes=None, unix=False):
+        self.n = n
+        self.t = t
+        self.prime = prime
+        self.rng = random.Random(seed)
+        self.player_classes = player_classes or {}
+        self.unix_dir = tempfile.mkdtemp() if unix else None
+        self.nodes = {i: Node(i, n, t, prime, self.rng.getrandbits(64), self.player_classes.get(i, Player))
+                      for i in range(1, n + 1)}
+
+    async def start(self):
+        for node in self.nodes.values():
+            await node.listen(self.unix_dir)
+        for node in self.nodes.values():
+            await node.connect(self.nodes.values())
+
+    async def close(self):
+        for node in self.nodes.values():
+            node.disconnect()
+        for node in self.nodes.values():
+            await node.close()
+        if self.unix_dir:
+            for name in os.listdir(self.unix_dir):
+                os.remove(os.path.join(self.unix_dir, name))
+            os.rmdir(self.unix_dir)
+
+    async def share_and_reconstruct(self, secret=None, dealer=None, timeout=60):
+        """
+        Runs SVSS-Share and SVSS-Reconstruct with the given (or a random) dealer and secret, and waits until every
+        honest player has reconstructed a value. Returns a dictionary describing the execution.
+        If a player raises an exception while handling a frame, the run stops and the exception is raised here.
+        """
+        if dealer is None:
+            dealer = self.rng.randint(1, self.n)
+        if secret is None:
+            secret = self.rng.randint(0, self.prime - 1 if self.prime else self.n ** 2)
+
+        honest = [node for node in self.nodes.values() if node.id not in self.player_classes]
+        frames = sum(node.frames_sent for node in self.nodes.values())
+        sent = sum(node.bytes_sent for node in self.nodes.values())
+        tag = (self.nodes[dealer].player.c + 1, dealer)
+        for node in self.nodes.values():
+            node.watch = tag
+            node.done.clear()
+
+        start = perf_counter()
+        self.nodes[dealer].player.deal_SVSS(secret)
+        finished = asyncio.ensure_future(asyncio.gather(*[node.done.wait() for node in honest]))
+        failed = [asyncio.ensure_future(node.failed.wait()) for node in self.nodes.values()]
+        await asyncio.wait([finished] + failed, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        end = perf_counter()
+        completed = finished.done()
+        for task in [finished] + failed:
+            task.cancel()
+        await asyncio.gather(finished, *failed, return_exceptions=True)
+        for node in self.nodes.values():
+            if node.error is not None:
+                raise node.error
+        if not completed:
+            raise asyncio.TimeoutError()
+
+        values = {node.id: node.player.SVSS_val.get(tag) for node in self.nodes.values()}
+        return {
+            "dealer": dealer,
+            "secret": secret,
+            "success": all(values[node.id] == secret for node in honest),
+            "values": values,
+            "latency": end - start,
+            "latencies": {node.id: node.finished[tag] - start for node in honest},
+            "frames": sum(node.frames_sent for node in self.nodes.values()) - frames,
+            "bytes": sum(node.bytes_sent for node in self.nodes.values()) - sent,
+        }
+
+
+async def measure_async(n, t, runs=1, prime=None, seed=None, player_classes=None, unix=False, timeout=60):
+    """
+    Runs SVSS on a fresh cluster runs times and returns the results, without the time it takes to set the clusters up.
+    """
+    results = []
+    for run in range(runs):
+        cluster = Cluster(n, t, prime, None if seed is None else seed + run, player_classes, unix)
+        await cluster.start()
+        try:
+            results.append(await cluster.share_and_reconstruct(timeout=timeout))
+        finally:
+            await cluster.close()
+    return results
+
+
+def measure(n, t, runs=1, prime=None, seed=None, player_classes=None, unix=False, timeout=60):
+    """ Runs measure_async in a new event loop. """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(measure_async(n, t, runs, prime, seed, player_classes, unix, timeout))
+    finally:
+        loop.close()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Run SVSS over sockets on localhost.")
+    parser.add_argument("n", type=int)
+    parser.add_argument("t", type=int)
+    parser.add_argument("--runs", type=int, default=1)
+    parser.add_argument("--prime", type=int, default=None, help="do all of the arithmetic in GF(prime)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--unix", action="store_true", help="use Unix sockets instead of TCP")
+    args = parser.parse_args()
+
+    results = measure(args.n, args.t, args.runs, args.prime, args.seed, unix=args.unix)
+    total = sum(result["latency"] for result in results)
+    for result in results:
+        print("dealer {}, success {}, latency {:.3f}s, {} frames, {} bytes".format(
+            result["dealer"], result["success"], result["latency"], result["frames"], result["bytes"]))
+    print("mean latency: {:.3f}s".format(total / len(results)), file=sys.stderr)
+    print("throughput: {:.2f} SVSS/s, {:.0f} frames/s, {:.0f} bytes/s".format(
+        len(results) / total, sum(result["frames"] for result in results) / total,
+        sum(result["bytes"] for result in results) / total), file=sys.stderr)
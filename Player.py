@@ -1,22 +1,48 @@
+import random
+
+from DelayIndex import DelayIndex
 from Polynomial import *
+from MWProgress import MWProgress
+from ProcessorSet import ProcessorSet
+from SLevels import SLevels
 from Message import *
 
 
 class Player:
-    def __init__(self, simulator, id, n, t):
+    def __init__(self, simulator, id, n, t, prime=None, rng=None):
         # Assume this processor is P_i
+        # If prime is given (or the simulator has one), all values are shared and reconstructed in GF(prime).
+        # Otherwise the values are integers, and the interpolations are done with floats.
+        if prime is None:
+            prime = getattr(simulator, "prime", None)
+        # The ids 1, ..., n are the evaluation points, so they have to be distinct and nonzero in the field.
+        if prime and (prime <= n or not is_prime(prime)):
+            raise ValueError("prime must be a prime larger than n = {}, got {}".format(n, prime))
+        # rng is a random number generator or a seed for the polynomials sampled by the player.
+        # If the simulator is seeded, the player gets its own generator seeded from the simulator's,
+        # so that replaying a schedule (which skips the simulator's random choices) samples the same polynomials.
+        if rng is None and isinstance(getattr(simulator, "rng", None), random.Random):
+            rng = simulator.rng.getrandbits(64)
+        self.rng = get_rng(rng)
         self.simulator = simulator
         self.id = id
         self.c = 0
-        self.D = set()  # {processor1, processor2, ...}. The D set from the protocol.
+        self.D = ProcessorSet()  # {processor1, processor2, ...}. The D set from the protocol.
         self.ACK = {}  # {tag: {(R, j): f_R(j)}. The ACK set from the protocol.
         self.DEAL = {}  # {tag: {sender: data}}. The DATA set from the protocol.
-        self.waiting = []  # Messages waiting from DMM.
-        self.invocations = {}  # {tag: (begin_time, end_time)}. If an invocation hasn't ended there will be None.
+        # {(sender, tag): [message1, ...]}. Messages delayed by DMM, by their sender and the tag of the ACK or DEAL entry
+        # for the sender which delays them.
+        self.waiting = {}
+        self.woken = []  # [message1, ...]. Delayed messages whose ACK or DEAL entry was removed, to be checked again.
+        self.invocations = {}  # {tag: [begin_time, end_time]}. None if it hasn't ended.
+        # The earliest ending invocation with ACK or DEAL entries for every sender, which delay_message uses. Entries
+        # should only be added and removed with add_entry, remove_entry and remove_entries, which keep it up to date.
+        self.delays = DelayIndex(self.invocations)
         self.n = n
         self.players = range(1, n+1)
         self.t = t
-        self.field = n ** 2
+        self.prime = prime
+        self.field = prime if prime else n ** 2
         self.MW_data = {}  # {tag: (polynomial, {j: f_j(i)})}. The data received from the dealer.
         self.MW_mod_data = {}  # {tag: polynomial}. The moderator's data received for the MW session.
         self.MW_corroborate = {}  # {tag: {j: f_i(j)}}. Data received which agrees with P_i's data.
@@ -31,6 +57,8 @@ class Player:
         self.MW_M = {}  # {tag: {processor1, ...}}. The received M sets.
         self.MW_secret_polys = {}  # {tag: (f, {j: f_j})}. The dealer's randomly sampled polynomials.
         self.MW_OK = set()  # {tag1, tag2, ...}. Tags for which an OK message has been received.
+        self.MW_OK_sent = set()  # {tag1, tag2, ...}. Tags for which the dealer has sent an OK message.
+        self.MW_progress = {}  # {tag: MWProgress}. The missing L sets and acks, counted as M, L and acks arrive.
         self.MW_share_done = set()  # {tag1, tag2, ...} . Tags for which the MW-Share protocol is done.
         self.MW_K = {}  # {tag: {dealer: [(moderator, f_dealer(moderator)]}}. The K sets for reconstructions.
         self.MW_waiting_K = {}  # {tag: [message1, message2, ...]. K messages waiting to be processed.
@@ -41,6 +69,7 @@ class Player:
         self.G = {}  # {tag: {dealer: {moderator1, moderator2, ...}}}. The G_j sets received from the dealer.
         self.S = {}  # {tag: {processor1, processor2, ...}}. The S_(t+1) set from the protocol.
         self.G_dealer = {}  # {tag: {dealer: {moderator1, moderator2, ...}}. The G set accumulated by the dealer.
+        self.S_dealer = {}  # {tag: SLevels}. The dealer's S levels, updated with G_dealer.
         self.G_sent = set()  # {tag1, tag2, ...}. The SVSS invocations for which the G set has been sent.
         self.SVSS_share_done = set() # {tag1, tag2, ...}. Tags for which the SVSS-Share protocol is done.
         self.SVSS_val = {}  # {tag: val}. The reconstructed values for SVSS.
@@ -50,27 +79,43 @@ class Player:
         This function filters, delays, or forwards a message to processing.
         In general, the receive function should never be called from outside, only DMM.
         """
-        tag = message.tag
+        if self.filter_message(message):
+            self.receive_waiting()
 
+    def DMM_many(self, messages):
+        """
+        Like calling DMM on every message in order, but the waiting messages are only checked once, after all of the
+        messages have been handled. So a waiting message released by one of the messages is handled after all of them,
+        and not right after the message which released it as with DMM.
+        """
         check_waiting = False
+        for message in messages:
+            if self.filter_message(message):
+                check_waiting = True
+
+        if check_waiting:
+            self.receive_waiting()
+
+    def filter_message(self, message):
+        """
+        This function does the work of DMM for a single message, except for checking the waiting messages.
+        Returns True iff DEAL or ACK entries blocking some waiting messages have been removed, in which case these
+        messages might not be delayed anymore.
+        """
+        tag = message.tag
+
         # Compare to ACK and DEAL, update the sets if necessary and D if a lie was detected.
         if message.RB and message.stage == Stage.MW_REC:
             point = (message.content[0], message.sender)
             if tag in self.ACK and point in self.ACK[tag]:
                 if self.ACK[tag][point] == message.content[1]:
-                    self.ACK[tag].pop(point)
-                    check_waiting = True
-                    if not self.ACK[tag]:
-                        self.ACK.pop(tag)
+                    self.remove_entry(self.ACK, tag, point)
                 else:
                     self.D.add(message.sender)
 
             if tag in self.DEAL and message.sender in self.DEAL[tag] and message.content[0] == self.id:
                 if self.DEAL[tag][message.sender] == message.content[1]:
-                    self.DEAL[tag].pop(message.sender)
-                    check_waiting = True
-                    if not self.DEAL[tag]:
-                        self.DEAL.pop(tag)
+                    self.remove_entry(self.DEAL, tag, message.sender)
                 else:
                     self.D.add(message.sender)
 
@@ -79,40 +124,96 @@ class Player:
             self.receive(message)
 
         elif message.sender not in self.D:
-            if self.delay_message(message, tag):
-                self.waiting.append(message)
-            else:
-                self.receive(message)
+            self.receive_or_delay(message)
 
-        # If DEAL or ACK have been updated, we need to check if some waiting messages should be processed.
-        if check_waiting:
-            to_receive = []
-            for message in self.waiting:
-                tag = message.tag
+        return bool(self.woken)
 
-                if not self.delay_message(message, tag):
-                    to_receive.append(message)
+    def receive_or_delay(self, message):
+        """ Processes the message, unless it should be delayed, in which case it's added to the waiting messages. """
+        blocking_tag = self.blocking_tag(message, message.tag)
+        if blocking_tag is None:
+            self.receive(message)
+        else:
+            key = (message.sender, blocking_tag)
+            if key not in self.waiting:
+                self.waiting[key] = []
+            self.waiting[key].append(message)
 
-            self.waiting = [message for message in self.waiting if message not in to_receive]
-            for message in to_receive:
-                self.receive(message)
+    def wake(self, sender, tag):
+        """
+        This function is to be called after removing the ACK or DEAL entry of the sender with the given tag.
+        The messages which were delayed because of it are checked again by receive_waiting.
+        """
+        if (sender, tag) in self.waiting:
+            self.woken += self.waiting.pop((sender, tag))
 
-    def delay_message(self, message, tag):
-        return self.delay_helper(message, tag, self.ACK, lambda x: x[1]) or self.delay_helper(message, tag, self.DEAL)
+    def entry_sender(self, table, entry):
+        """ Returns the sender whose messages an entry of table (ACK or DEAL) can delay. """
+        return entry[1] if table is self.ACK else entry
 
-    def delay_helper(self, message, tag, check_against, key=lambda x: x):
-        sender = message.sender
+    def add_entry(self, table, tag, entry, data):
+        """ Adds an entry to ACK or DEAL, and to the delay index. """
+        entries = self.open_entries(table, tag)
+        if entry not in entries:
+            self.delays.add(tag, self.entry_sender(table, entry))
+        entries[entry] = data
 
-        for check_tag in check_against:
-            if self.invocations[check_tag][1] is None:
-                continue
+    def remove_entry(self, table, tag, entry):
+        """
+        Removes an entry from ACK or DEAL (and the tag if it has no entries left), and from the delay index.
+        The messages which were delayed because of it are woken.
+        """
+        table[tag].pop(entry)
+        if not table[tag]:
+            table.pop(tag)
+        sender = self.entry_sender(table, entry)
+        self.delays.remove(tag, sender)
+        self.wake(sender, tag)
+
+    def open_entries(self, table, tag):
+        """ Returns the entries of a tag in ACK or DEAL, adding the tag with no entries if it isn't there. """
+        return table.setdefault(tag, {})
 
-            for elem in check_against[check_tag]:
-                if sender == key(elem) and ((self.invocations[check_tag][1] and tag not in self.invocations)
-                                            or self.invocations[check_tag][1] < self.invocations[tag][0]):
-                    return True
+    def reset_entries(self, table, tag):
+        """ Removes the entries of a tag from ACK or DEAL like remove_entries, and adds the tag back empty. """
+        self.remove_entries(table, tag)
+        self.open_entries(table, tag)
 
-        return False
+    def remove_entries(self, table, tag):
+        """ Removes a tag from ACK or DEAL like remove_entry does for each of its entries. """
+        for entry in table.pop(tag, ()):
+            sender = self.entry_sender(table, entry)
+            self.delays.remove(tag, sender)
+            self.wake(sender, tag)
+
+    def receive_waiting(self):
+        """
+        This function is to be called after DEAL or ACK have been updated.
+        It processes the woken messages which shouldn't be delayed anymore, and delays the rest again.
+        """
+        while self.woken:
+            woken = self.woken
+            self.woken = []
+            for message in woken:
+                self.receive_or_delay(message)
+
+    def delay_message(self, message, tag):
+        return self.blocking_tag(message, tag) is not None
+
+    def blocking_tag(self, message, tag):
+        """
+        Returns the tag of an ACK or DEAL entry because of which the message should be delayed, or None.
+        If any ended invocation with an entry for the sender delays the message, so does the one which ended first.
+        """
+        earliest = self.delays.earliest_end(message.sender)
+        if earliest is None:
+            return None
+
+        end, check_tag = earliest
+        if tag in self.invocations:
+            return check_tag if end < self.invocations[tag][0] else None
+        # An invocation which hasn't begun is delayed by the invocations which ended after time 0.
+        return check_tag if end else self.delays.ended_after(message.sender, 0)
 
     def send(self, message, to):
         if self.simulator:
@@ -132,18 +233,23 @@ class Player:
         tag = (c, SVSS_d, self.id, moderator, poly_tag)
         self.invocations[tag] = [time, None]
 
-        f = Polynomial.random_polynomial(secret, self.t, self.field)
-        polys = {i: Polynomial.random_polynomial(f.eval(i), self.t, self.field) for i in self.players}
+        f = Polynomial.random_polynomial(secret, self.t, self.field, self.prime, self.rng)
+        polys = {i: Polynomial.random_polynomial(val, self.t, self.field, self.prime, self.rng)
+                 for i, val in zip(self.players, f.eval_many(self.players))}
 
-        for i in self.players:
-            content = (polys[i], {j: polys[j].eval(i) for j in self.players})
+        # table[j][i] = f_j(i), computed with a single batched evaluation.
+        # The values are also stored in the polynomials' evaluation tables for dealer_check_ok.
+        table = dict(zip(self.players, Polynomial.eval_table([polys[j] for j in self.players], self.players, True)))
+
+        for k, i in enumerate(self.players):
+            content = (polys[i], {j: table[j][k] for j in self.players})
             message = Message(content, tag, self.id, Stage.MW_VALUES, moderator)
 
             self.send(message, i)
 
         mod_message = Message(f, tag, self.id, Stage.MW_VALUES, moderator)
         self.send(mod_message, moderator)
-        self.ACK[tag] = {}
+        self.reset_entries(self.ACK, tag)
         self.MW_secret_polys[tag] = (f, polys)
 
     def receive(self, message):
@@ -210,11 +316,13 @@ class Player:
                 return
 
             self.MW_mod_data[tag] = message.content
-            self.MW_mod_M[tag] = set()
+            self.MW_mod_M[tag] = ProcessorSet()
 
             messages = []
             if tag in self.MW_mod_corroborate:
-                messages = self.MW_mod_corroborate[tag]
+                # Sorted, so that the order doesn't depend on the memory addresses of the messages, and a seed
+                # determines the execution.
+                messages = sorted(self.MW_mod_corroborate[tag], key=lambda message: message.sender)
 
             self.MW_mod_corroborate[tag] = set()
             for message in messages:
@@ -222,7 +330,7 @@ class Player:
 
         else:
             self.MW_data[tag] = message.content
-            self.DEAL[tag] = {}
+            self.reset_entries(self.DEAL, tag)
             ack = Message(None, message.tag, self.id, Stage.MW_ACK, message.moderator)
             self.RB(ack)
             for i in self.players:
@@ -231,7 +339,7 @@ class Player:
                 self.send(data_message, i)
 
             if tag not in self.MW_ack:
-                self.MW_ack[tag] = set()
+                self.MW_ack[tag] = ProcessorSet()
 
             if tag in self.MW_corroborate:
                 messages = self.MW_corroborate[tag]
@@ -246,9 +354,11 @@ class Player:
 
         tag = message.tag
         if tag not in self.MW_ack:
-            self.MW_ack[tag] = set()
+            self.MW_ack[tag] = ProcessorSet()
 
-        self.MW_ack[tag].add(message.sender)
+        if message.sender not in self.MW_ack[tag]:
+            self.MW_ack[tag].add(message.sender)
+            self.get_MW_progress(tag).ack(message.sender, self.MW_M.get(tag))
 
         self.process_mw_ack_corr(tag, message.sender)
 
@@ -267,7 +377,7 @@ class Player:
         sender = message.sender
 
         if tag in self.MW_data:
-            if self.MW_data[tag][0].eval(sender) == message.content:
+            if self.MW_data[tag][0].eval_cached(sender) == message.content:
                 self.MW_corroborate[tag][sender] = message.content
                 self.process_mw_ack_corr(tag, sender)
         else:
@@ -283,18 +393,17 @@ class Player:
         """
 
         mod = tag[3]
-        if tag not in self.DEAL:
-            self.DEAL[tag] = {}
+        self.open_entries(self.DEAL, tag)
         if tag in self.MW_data and sender in self.MW_corroborate[tag] and sender in self.MW_ack[tag]\
                 and len(self.DEAL[tag]) < self.n - self.t:
-            self.DEAL[tag][sender] = self.MW_corroborate[tag].pop(sender)
+            self.add_entry(self.DEAL, tag, sender, self.MW_corroborate[tag].pop(sender))
 
             if len(self.DEAL[tag]) == self.n - self.t:
-                message = Message(set(self.DEAL[tag].keys()), tag, self.id, Stage.MW_L, mod, RB=True)
+                message = Message(ProcessorSet(self.DEAL[tag]), tag, self.id, Stage.MW_L, mod, RB=True)
                 self.RB(message)
 
                 poly = self.MW_data[tag][0]
-                mod_message = Message(poly.eval(0), tag, self.id, Stage.MW_L, mod)
+                mod_message = Message(poly.eval_cached(0), tag, self.id, Stage.MW_L, mod)
                 self.send(mod_message, mod)
 
     def receive_MW_L(self, message):
@@ -306,7 +415,10 @@ class Player:
             if tag not in self.MW_L:
                 self.MW_L[tag] = {}
 
+            old = self.MW_L[tag].get(message.sender)
             self.MW_L[tag][message.sender] = message.content
+            self.get_MW_progress(tag).set_L(message.sender, old, message.content, self.MW_ack.get(tag, ()),
+                                            self.MW_M.get(tag))
 
             if message.moderator == self.id:
                 self.process_mw_ack_L(tag, message.sender)
@@ -325,7 +437,7 @@ class Player:
             self.MW_mod_corroborate[tag] = set()
 
         if tag in self.MW_mod_data:
-            if self.MW_mod_data[tag].eval(message.sender) == message.content:
+            if self.MW_mod_data[tag].eval_cached(message.sender) == message.content:
                 self.MW_mod_corroborate[tag].add(message.sender)
         else:
             self.MW_mod_corroborate[tag].add(message)
@@ -356,6 +468,7 @@ class Player:
 
         if len(message.content) >= self.n - self.t:
             self.MW_M[tag] = message.content
+            self.get_MW_progress(tag).set_M(message.content, self.MW_L.get(tag, {}))
 
             if message.tag[0] == self.id:
                 self.dealer_check_ok(tag)
@@ -369,20 +482,14 @@ class Player:
         """
         This function is to be called only by an MW-SVSS dealer.
         This function should be called after receiving an M message, an ack message, or an L message.
-        This function checks if the share is done and if so it sends an OK message.
+        This function checks if the share is done and if so it sends an OK message, once.
         """
 
-        if tag in self.MW_M and tag in self.MW_L and tag in self.MW_ack and tag in self.ACK:
-            for j in self.MW_M[tag]:
-                if j not in self.MW_L[tag]:
-                    return
-                for l in self.MW_L[tag][j]:
-                    if l not in self.MW_ack[tag]:
-                        return
-
+        if tag in self.ACK and tag not in self.MW_OK_sent and tag in self.MW_progress and self.MW_progress[tag].done():
+            self.MW_OK_sent.add(tag)
             for j in self.MW_M[tag]:
                 for l in self.MW_L[tag][j]:
-                    self.ACK[tag][(j, l)] = self.MW_secret_polys[tag][1][j].eval(l)
+                    self.add_entry(self.ACK, tag, (j, l), self.MW_secret_polys[tag][1][j].eval_cached(l))
 
             message = Message(None, tag, self.id, Stage.MW_OK, tag[3], True)
             self.RB(message)
@@ -396,15 +503,16 @@ class Player:
         """
         if tag in self.MW_OK and tag in self.MW_M and tag in self.MW_L and tag in self.MW_ack:
             if self.id not in self.MW_M[tag] and tag in self.DEAL:
-                self.DEAL.pop(tag)
-            for l in self.MW_M[tag]:
-                if l not in self.MW_L[tag]:
-                    return
-                for k in self.MW_L[tag][l]:
-                    if k not in self.MW_ack[tag]:
-                        return
-            self.MW_share_done.add(tag)
-            self.check_SVSS_share_done(tag)
+                self.remove_entries(self.DEAL, tag)
+            if self.MW_progress[tag].done():
+                self.MW_share_done.add(tag)
+                self.check_SVSS_share_done(tag)
+
+    def get_MW_progress(self, tag):
+        """ Returns the MWProgress of the tag, creating it if necessary. """
+        if tag not in self.MW_progress:
+            self.MW_progress[tag] = MWProgress()
+        return self.MW_progress[tag]
 
     def receive_MW_OK(self, message):
         """ This function is to be called if an OK message is received. """
@@ -488,26 +596,20 @@ class Player:
         if dealer not in self.MW_val[SVSS_tag][poly_tag]:
             self.MW_val[SVSS_tag][poly_tag][dealer] = {}
 
+        # Each K set has exactly t+1 points, so the interpolated polynomial always has degree at most t.
         for l in self.MW_K[tag]:
-            poly = Polynomial.interpolate(self.MW_K[tag][l])
-            if poly.deg > self.t:
-
-                self.set_MW_value(None, SVSS_tag, dealer, mod, poly_tag)
-                return
-
-            points.append((l,poly.eval(0)))
+            points.append((l, Polynomial.interpolate_at_zero(self.MW_K[tag][l], self.prime)))
 
         self.invocations[tag][1] = self.simulator.time()
+        self.delays.ended(tag)
 
-        poly = Polynomial.interpolate(points)
+        # val is None if the points don't lie on a polynomial of degree at most t.
+        consistent, val = Polynomial.bounded_value_at_zero(points, self.t, self.prime)
 
         if SVSS_tag not in self.MW_val:
             self.MW_val[SVSS_tag] = {PolyTag.G: {}, PolyTag.H: {}}
 
-        if poly.deg > self.t:
-            self.set_MW_value(None, SVSS_tag, dealer, mod, poly_tag)
-        else:
-            self.set_MW_value(poly.eval(0), SVSS_tag, dealer, mod, poly_tag)
+        self.set_MW_value(val, SVSS_tag, dealer, mod, poly_tag)
 
     def set_MW_value(self, val, SVSS_tag, dealer, mod, poly_tag):
         """
@@ -522,14 +624,11 @@ class Player:
         This function deals a secret with the surrent processor as dealer.
         """
         self.c += 1
-        poly = BivariatePolynomial.random_polynomial(secret, self.t, self.field)
+        poly = BivariatePolynomial.random_polynomial(secret, self.t, self.field, self.prime, self.rng)
         tag = (self.c, self.id)
         self.invocations[tag] = [self.simulator.time(), None]
 
-        for player in self.players:
-            g = poly.g(player)
-            h = poly.h(player)
-
+        for player, g, h in zip(self.players, poly.g_many(self.players), poly.h_many(self.players)):
             message = Message((g, h), tag, self.id, Stage.SVSS_VALUES)
             self.send(message, player)
 
@@ -542,13 +641,13 @@ class Player:
         # Refactored once in order to have the dealer and moderator of MW-SVSS in the tag,
         # then a second time in order to include a tag for which value the dealer is sharing.
 
-        g = message.content[0]
-        h = message.content[1]
-        for player in self.players:
-            self.deal_MW(g.eval(player), message.tag[0], message.tag[1], player, PolyTag.G)
-            self.deal_MW(h.eval(player), message.tag[0], message.tag[1], player, PolyTag.H)
-            self.MW_moderate(g.eval(player), message.tag[0], message.tag[1], player, PolyTag.H)
-            self.MW_moderate(h.eval(player), message.tag[0], message.tag[1], player, PolyTag.G)
+        g, h = message.content
+        g_vals, h_vals = Polynomial.eval_table([g, h], self.players)
+        for player, g_val, h_val in zip(self.players, g_vals, h_vals):
+            self.deal_MW(g_val, message.tag[0], message.tag[1], player, PolyTag.G)
+            self.deal_MW(h_val, message.tag[0], message.tag[1], player, PolyTag.H)
+            self.MW_moderate(g_val, message.tag[0], message.tag[1], player, PolyTag.H)
+            self.MW_moderate(h_val, message.tag[0], message.tag[1], player, PolyTag.G)
 
     def check_SVSS_share_done(self, tag):
         """
@@ -574,24 +673,15 @@ class Player:
             return
 
         if SVSS_tag not in self.G_dealer:
-            self.G_dealer[SVSS_tag] = {}
-            for player in self.players:
-                self.G_dealer[SVSS_tag][player] = set()
+            self.S_dealer[SVSS_tag] = SLevels(self.players, self.n - self.t, self.t + 2)
+            self.G_dealer[SVSS_tag] = self.S_dealer[SVSS_tag].G
 
         self.add_to_G_dealer(tag)
 
-        S = [set([p for p in self.players])]
-        S += [set() for i in range(self.t+1)]
-
-        for i in range(self.t + 1):
-            for j in S[i]:
-                if len(self.G_dealer[SVSS_tag][j].intersection(S[i])) >= self.n - self.t:
-                    S[i + 1].add(j)
-
-        if len(S[-1]) >= self.n - self.t:
+        if self.S_dealer[SVSS_tag].done():
             self.G_sent.add(SVSS_tag)
 
-            content = (S, self.G_dealer[SVSS_tag])
+            content = (self.S_dealer[SVSS_tag].S, self.G_dealer[SVSS_tag])
             message = Message(content, SVSS_tag, self.id, Stage.SVSS_G, RB=True)
             self.RB(message)
 
@@ -619,8 +709,7 @@ class Player:
                 (c, d, SVSS_d, SVSS_m, PolyTag.H) in self.MW_share_done and \
                 (c, d, SVSS_m, SVSS_d, PolyTag.G) in self.MW_share_done and \
                 (c, d, SVSS_m, SVSS_d, PolyTag.H) in self.MW_share_done:
-            self.G_dealer[SVSS_tag][SVSS_m].add(SVSS_d)
-            self.G_dealer[SVSS_tag][SVSS_d].add(SVSS_m)
+            self.S_dealer[SVSS_tag].add_edge(SVSS_d, SVSS_m)
 
     def receive_SVSS_G(self, message):
         """
@@ -629,11 +718,15 @@ class Player:
         where the SVSS-Share protocol never completes.
         """
         S, G = message.content
-
-        if S[0] != set([p for p in self.players]):
+        if len(S) != self.t + 2:
             return
+        processors = [j for level in S for j in level] + [k for j in G for k in [j] + list(G[j])]
+        if not all(isinstance(j, int) and j in self.players for j in processors):
+            return
+        S = [ProcessorSet(level) for level in S]
+        G = {j: ProcessorSet(G[j]) for j in G}
 
-        if len(S) != self.t + 2:
+        if S[0] != ProcessorSet(self.players):
             return
 
         if len(S[self.t + 1]) < self.n - self.t:
@@ -641,12 +734,12 @@ class Player:
 
         for i in range(self.t + 1):
             for j in S[i + 1]:
-                if len(G[j].intersection(S[i])) < self.n - self.t:
+                if j not in G or G[j].intersection_size(S[i]) < self.n - self.t:
                     return
 
         for j in G:
             for k in G[j]:
-                if j not in G[k]:
+                if k not in G or j not in G[k]:
                     return
 
         self.G[message.tag] = G
@@ -733,7 +826,7 @@ class Player:
         This function interpolates the points and checks validity.
         In the end, SVSS_val is always updated, possibly with a None value.
         """
-        I = set()
+        I = ProcessorSet()
 
         g_polys = {}
         h_polys = {}
@@ -752,10 +845,10 @@ class Player:
             if k in I:
                 continue
 
-            g = Polynomial.interpolate(g_points)
-            h = Polynomial.interpolate(h_points)
+            g = Polynomial.interpolate_bounded(g_points, self.t, self.prime)
+            h = Polynomial.interpolate_bounded(h_points, self.t, self.prime)
 
-            if g.deg > self.t or h.deg > self.t:
+            if g is None or h is None:
                 I.add(k)
             else:
                 g_polys[k] = g
@@ -764,23 +857,36 @@ class Player:
         reconstruct_set = [i for i in self.S[SVSS_tag] if i not in I]
 
         if len(reconstruct_set) < self.n - self.t:
-            self.SVSS_val[SVSS_tag] = None
+            self.set_SVSS_value(None, SVSS_tag)
             return
 
-        for i in reconstruct_set:
-            for j in reconstruct_set:
-                if g_polys[i].eval(j) != h_polys[j].eval(i):
-                    self.SVSS_val[SVSS_tag] = None
-                    return
+        # g_i(j) must equal h_j(i) for every i, j in the set, i.e. the table of the g polynomials at the set must be the
+        # transpose of the table of the h polynomials.
+        g_table = Polynomial.eval_table([g_polys[i] for i in reconstruct_set], reconstruct_set)
+        h_table = Polynomial.eval_table([h_polys[j] for j in reconstruct_set], reconstruct_set)
+        for g_row, h_column in zip(g_table, zip(*h_table)):
+            if tuple(g_row) != h_column:
+                self.set_SVSS_value(None, SVSS_tag)
+                return
 
         g_points = [(i, g_polys[i].eval(0)) for i in g_polys]
         h_points = [(i, h_polys[i].eval(0)) for i in h_polys]
 
-        g_val = Polynomial.interpolate(g_points).eval(0)
-        h_val = Polynomial.interpolate(h_points).eval(0)
+        g_val = Polynomial.interpolate_at_zero(g_points, self.prime)
+        h_val = Polynomial.interpolate_at_zero(h_points, self.prime)
 
         if g_val != h_val:
-            self.SVSS_val[SVSS_tag] = None
+            self.set_SVSS_value(None, SVSS_tag)
 
         else:
-            self.SVSS_val[SVSS_tag] = g_val
+            self.set_SVSS_value(g_val, SVSS_tag)
+
+    def set_SVSS_value(self, val, SVSS_tag):
+        """
+        This function should be called in order to add a value to SVSS_val instead of setting it directly.
+        The function also lets the simulator know that the SVSS-Reconstruct invocation is done.
+        """
+        self.SVSS_val[SVSS_tag] = val
+        SVSS_done = getattr(self.simulator, "SVSS_done", None)
+        if SVSS_done:
+            SVSS_done(self.id, SVSS_tag)
@@ -1,24 +1,74 @@
+from fractions import Fraction
+from functools import lru_cache
+from operator import add, mul
+import random
 from random import randint
 
+import NTT
+
+# The number of distinct point sets for which the Lagrange weights are kept.
+LAGRANGE_CACHE_SIZE = 1024
+# The number of distinct point sets for which the powers of the points are kept.
+VANDERMONDE_CACHE_SIZE = 128
+
 
 class Polynomial:
-    def __init__(self, coefficients):
-        self.coef = coefficients
-        self.minimize()
-        self.deg = len(self.coef) - 1
+    """
+    An immutable univariate polynomial, with the coefficients ordered from the free coefficient upwards.
+    If a prime is given, all of the arithmetic is done in GF(prime) and no floats are ever used.
+    Otherwise the coefficients are regular python numbers.
+    Since polynomials are never changed after they are created, they can be shared and hashed freely.
+    The only mutable part is the evaluation table, which caches values computed by eval_cached and tabulate.
+    It's only created for polynomials which are evaluated that way, and holds at most EVAL_CACHE_SIZE values.
+    """
+    __slots__ = ("coef", "deg", "prime", "evals")
+
+    # Over NTT.NTT_PRIME, interpolations with at least this many points use the O(n log^2 n) subproduct tree algorithm
+    # instead of the quadratic one. `python benchmark.py crossover` measures the crossover, which was between 16 and 128
+    # in repeated runs on the development machine. The largest value is used, where the fast path reliably wins.
+    # Evaluation tables always use the Vandermonde product: for the tables the protocols build (n polynomials of
+    # degree about n/3 at n points) the subproduct tree doesn't win below n = 8192, far above any realistic n.
+    FAST_INTERPOLATE_THRESHOLD = 128
+    # The maximal number of values in the evaluation table of a polynomial. Further values are computed every time.
+    # The protocols only evaluate at 0 and the ids of the players, so this only limits unexpected uses.
+    EVAL_CACHE_SIZE = 1024
+
+    def __init__(self, coefficients, prime=None):
+        if prime:
+            coef = tuple(c % prime for c in coefficients)
+        else:
+            coef = tuple(coefficients)
+
+        # Remove the zero coefficients of the highest degrees, but keep at least one coefficient.
+        end = len(coef)
+        while end > 1 and coef[end - 1] == 0:
+            end -= 1
+        if end < len(coef):
+            coef = coef[:end]
+
+        object.__setattr__(self, "coef", coef)
+        object.__setattr__(self, "deg", len(coef) - 1)
+        object.__setattr__(self, "prime", prime)
+        object.__setattr__(self, "evals", None)
+
+    def __setattr__(self, key, value):
+        raise AttributeError("Polynomial is immutable")
+
+    def __reduce__(self):
+        return Polynomial, (self.coef, self.prime)
 
     def __add__(self, other):
         if self.deg >= other.deg:
-            res = self.coef[:]
+            res = list(self.coef)
             oth = other.coef
         else:
-            res = other.coef[:]
+            res = list(other.coef)
             oth = self.coef
 
         for i, val in enumerate(oth):
             res[i] += val
 
-        return Polynomial(res)
+        return Polynomial(res, self.prime or other.prime)
 
     def __mul__(self, other):
         deg = self.deg + other.deg
@@ -27,34 +77,146 @@ class Polynomial:
             for j, u in enumerate(other.coef):
                 coefficients[i+j] += u * v
 
-        return Polynomial(coefficients)
+        return Polynomial(coefficients, self.prime or other.prime)
 
     def cmult(self, c):
-        for i in range(len(self.coef)):
-            self.coef[i] *= c
-        return self
+        """ Returns the polynomial multiplied by the constant c. """
+        return Polynomial([v * c for v in self.coef], self.prime)
 
     def eval(self, x):
-        power = 1
         total = 0
-
-        for c in self.coef:
-            total += power * c
-            power *= x
+        if self.prime:
+            for c in reversed(self.coef):
+                total = (total * x + c) % self.prime
+        else:
+            for c in reversed(self.coef):
+                total = total * x + c
 
         return total
 
-    def minimize(self):
+    def eval_cached(self, x):
+        """ Like eval, but the value is looked up in (or added to) the polynomial's evaluation table. """
+        evals = self.evaluation_table()
+        if x in evals:
+            return evals[x]
+        value = self.eval(x)
+        if len(evals) < Polynomial.EVAL_CACHE_SIZE:
+            evals[x] = value
+        return value
+
+    def tabulate(self, xs):
+        """ Fills the evaluation table for every point of xs at once, so that later eval_cached calls are lookups. """
+        Polynomial.eval_table([self], xs, store=True)
+        return self
+
+    def evaluation_table(self):
+        """ Returns the {x: value} table of the values computed so far. """
+        if self.evals is None:
+            object.__setattr__(self, "evals", {})
+        return self.evals
+
+    def eval_many(self, xs):
+        """ Returns the values of the polynomial at every point of xs, in the same order. """
+        return Polynomial.eval_table([self], xs)[0]
+
+    @staticmethod
+    def eval_table(polys, xs, store=False):
+        """
+        Evaluates every polynomial at every point of xs in one go, so that table[i][j] = polys[i].eval(xs[j]).
+        This is the product of the coefficient matrix and the (cached) Vandermonde matrix of xs.
+        All of the polynomials are assumed to be over the same field.
+        If store is True, the values are also added to the evaluation tables of the polynomials.
+        """
+        if not polys:
+            return []
+
+        xs = tuple(xs)
+        prime = polys[0].prime
+
+        rows = vandermonde(xs, max(p.deg for p in polys), prime)
+        if prime:
+            table = [[sum(map(mul, p.coef, row)) % prime for row in rows] for p in polys]
+        else:
+            table = [[sum(map(mul, p.coef, row)) for row in rows] for p in polys]
+
+        if store:
+            for p, vals in zip(polys, table):
+                evals = p.evaluation_table()
+                for x, value in zip(xs, vals):
+                    if len(evals) >= Polynomial.EVAL_CACHE_SIZE:
+                        break
+                    evals[x] = value
 
-        while len(self.coef) > 1 and self.coef[-1] == 0:
-            self.coef.pop()
+        return table
 
     @staticmethod
-    def interpolate(vals):
-        total = Polynomial([0])
+    def interpolate(vals, prime=None):
+        if prime == NTT.NTT_PRIME and len(vals) >= Polynomial.FAST_INTERPOLATE_THRESHOLD:
+            return Polynomial(NTT.interpolate([x for x, y in vals], [y for x, y in vals]), prime)
+        return Polynomial.interpolate_barycentric(vals, prime)
+
+    @staticmethod
+    def interpolate_barycentric(vals, prime=None):
+        """
+        Interpolates the points in O(k^2) using barycentric weights.
+        The master polynomial prod(x - x_i) is built once, and each basis polynomial is obtained from it by a
+        synthetic division, so only k inverses (or fractions) are needed.
+        Without a prime the computation is done with exact fractions and the coefficients are rounded at the end.
+        """
+        k = len(vals)
+
+        master = [1]
+        for x_i, y_i in vals:
+            shifted = [0] + master
+            for j in range(len(master)):
+                shifted[j] -= x_i * master[j]
+            if prime:
+                shifted = [c % prime for c in shifted]
+            master = shifted
+
+        coefficients = [0] * k
+        for i, (x_i, y_i) in enumerate(vals):
+            denominator = 1
+            for j, (x_j, y_j) in enumerate(vals):
+                if i != j:
+                    denominator *= x_i - x_j
+                    if prime:
+                        denominator %= prime
+
+            if prime:
+                scale = y_i * inverse(denominator, prime) % prime
+            else:
+                scale = Fraction(y_i) / denominator
+
+            if not scale:
+                continue
+
+            # Synthetic division of the master polynomial by (x - x_i).
+            carry = 0
+            for j in range(k, 0, -1):
+                carry = master[j] + carry * x_i
+                if prime:
+                    carry %= prime
+                coefficients[j - 1] += scale * carry
+
+        if prime:
+            return Polynomial(coefficients, prime)
+
+        return Polynomial([round(c) for c in coefficients])
+
+    @staticmethod
+    def interpolate_lagrange(vals, prime=None):
+        """
+        Interpolates the points by summing the Lagrange basis polynomials, which takes O(k^3).
+        This is kept as a reference implementation for interpolate_barycentric.
+        """
+        total = Polynomial([0], prime)
 
         for i in range(len(vals)):
-            total += Polynomial.lagrange_basis(vals, i).cmult(vals[i][1])
+            total += Polynomial.lagrange_basis(vals, i, prime).cmult(vals[i][1])
+
+        if prime:
+            return total
 
         # This is one solution, this becomes worse the more elements we have
         res = [round(c) for c in total.coef]
@@ -62,103 +224,287 @@ class Polynomial:
         return Polynomial(res)
 
     @staticmethod
-    def lagrange_basis(vals,index):
-        total = Polynomial([1])
+    def interpolate_at_zero(vals, prime=None):
+        """
+        Returns the value at 0 of the interpolated polynomial without computing its coefficients.
+        The Lagrange weights are cached for each set of x coordinates, so this is a dot product for repeated point sets.
+        """
+        vals = sorted(vals)
+        weights = lagrange_weights(tuple(x for x, y in vals), 0, prime)
+        total = sum(w * y for w, (x, y) in zip(weights, vals))
+
+        if prime:
+            return total % prime
+        return round(total)
+
+    @staticmethod
+    def bounded_value_at_zero(vals, deg, prime=None):
+        """
+        Checks whether the points lie on a polynomial of degree at most deg without interpolating all of them.
+        The first deg+1 points determine the polynomial, and every other point is checked against the cached Lagrange
+        weights of these points, so no polynomial is ever built.
+        Returns (True, f(0)) if the points are consistent and (False, None) otherwise.
+        """
+        vals = sorted(vals)
+        base = vals[:deg + 1]
+        xs = tuple(x for x, y in base)
+
+        for x, y in vals[deg + 1:]:
+            weights = lagrange_weights(xs, x, prime)
+            total = sum(w * b for w, (a, b) in zip(weights, base))
+            if prime:
+                total %= prime
+                y %= prime
+            if total != y:
+                return False, None
+
+        return True, Polynomial.interpolate_at_zero(base, prime)
+
+    @staticmethod
+    def interpolate_bounded(vals, deg, prime=None):
+        """
+        Returns the polynomial of degree at most deg which passes through all of the points, or None if there isn't one.
+        Only deg+1 points are interpolated, the rest are checked by evaluation.
+        """
+        base = vals[:deg + 1]
+        poly = Polynomial.interpolate(base, prime)
+
+        for x, y in vals[deg + 1:]:
+            if prime:
+                y %= prime
+            if poly.eval(x) != y:
+                return None
+
+        return poly
+
+    @staticmethod
+    def lagrange_basis(vals, index, prime=None):
+        total = Polynomial([1], prime)
         for i in range(len(vals)):
             if i != index:
-                p = Polynomial([-vals[i][0],1])
-                p.cmult(1/(vals[index][0] - vals[i][0]))
+                p = Polynomial([-vals[i][0], 1], prime)
+                if prime:
+                    p = p.cmult(inverse(vals[index][0] - vals[i][0], prime))
+                else:
+                    p = p.cmult(1/(vals[index][0] - vals[i][0]))
                 total *= p
 
         return total
 
     @staticmethod
-    def random_polynomial(secret, deg, field):
+    def random_polynomial(secret, deg, field, prime=None, rng=None):
+        """
+        Samples a polynomial of degree at most deg with the given secret as its free coefficient.
+        If a prime is given the coefficients are sampled from GF(prime) and field is ignored.
+        rng is the random number generator to use (the global one by default).
+        """
+        if prime:
+            field = prime - 1
+        rng = get_rng(rng)
+
         coef = [secret]
         for i in range(deg):
-            coef.append(randint(0, field))
+            coef.append(rng.randint(0, field))
 
-        return Polynomial(coef)
+        return Polynomial(coef, prime)
 
     def __repr__(self):
-        return str(self.coef)
+        return str(list(self.coef))
 
     def __str__(self):
-        return str(self.coef)
+        return str(list(self.coef))
 
     def __eq__(self, other):
+        if not isinstance(other, Polynomial):
+            return NotImplemented
         return self.coef == other.coef
 
+    def __hash__(self):
+        return hash(self.coef)
+
+
+def get_rng(rng):
+    """
+    Returns a random number generator: rng itself if it already is one, a new generator seeded with rng if it is a
+    seed, and the global generator of the random module if it is None.
+    """
+    if rng is None:
+        return random
+    if hasattr(rng, "randrange"):
+        return rng
+    return random.Random(rng)
+
+
+def inverse(a, prime):
+    """ Returns the multiplicative inverse of a in GF(prime). """
+    a %= prime
+    if a == 0:
+        raise ZeroDivisionError("0 has no inverse in GF(" + str(prime) + ")")
+    return pow(a, prime - 2, prime)
+
+
+@lru_cache(maxsize=LAGRANGE_CACHE_SIZE)
+def lagrange_weights(xs, at=0, prime=None):
+    """
+    Returns the values at the point at of the Lagrange basis polynomials of the points xs.
+    Without a prime the weights are exact fractions.
+    """
+    weights = []
+    for i, x_i in enumerate(xs):
+        numerator = 1
+        denominator = 1
+        for j, x_j in enumerate(xs):
+            if i != j:
+                numerator *= at - x_j
+                denominator *= x_i - x_j
+
+        if prime:
+            weights.append(numerator * inverse(denominator, prime) % prime)
+        else:
+            weights.append(Fraction(numerator, denominator))
+
+    return tuple(weights)
+
+
+@lru_cache(maxsize=VANDERMONDE_CACHE_SIZE)
+def vandermonde(xs, deg, prime=None):
+    """ Returns the rows (1, x, ..., x^deg) for every x in xs, reduced modulo the prime if there is one. """
+    rows = []
+    for x in xs:
+        row = [1]
+        for i in range(deg):
+            row.append(row[-1] * x % prime if prime else row[-1] * x)
+        rows.append(tuple(row))
+
+    return tuple(rows)
+
+
+def is_prime(p):
+    """
+    Miller-Rabin with the first 13 primes as bases, which is exact below 3.3 * 10^24 (and almost always right above).
+    """
+    bases = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41)
+    if p < 2:
+        return False
+    for q in bases:
+        if p % q == 0:
+            return p == q
+
+    d = p - 1
+    s = 0
+    while d % 2 == 0:
+        d //= 2
+        s += 1
+    for a in bases:
+        x = pow(a, d, p)
+        if x == 1 or x == p - 1:
+            continue
+        for i in range(s - 1):
+            x = x * x % p
+            if x == p - 1:
+                break
+        else:
+            return False
+    return True
+
+
+def next_prime(p):
+    """ Returns the smallest prime which is at least p. """
+    while not is_prime(p):
+        p += 1
+    return p
+
 
 class BivariatePolynomial:
-    def __init__(self, coefficients):
+    """
+    A bivariate polynomial, stored as a dense matrix where coef[i][j] is the coefficient of x^i * y^j.
+    Like Polynomial, all of the arithmetic is done in GF(prime) if a prime is given.
+    """
+    def __init__(self, coefficients, prime=None):
+        self.prime = prime
         self.coef = coefficients
         self.minimize()
         self.x_deg = len(self.coef) - 1
-        self.y_deg = max(len(c) for c in self.coef) - 1
+        self.y_deg = len(self.coef[0]) - 1
 
     def minimize(self):
-        res = [Polynomial(poly).coef for poly in self.coef]
-        while len(res) > 1 and res[-1] == [0]:
+        """ Pads the rows to the same length and removes all zero rows and columns from the end. """
+        width = max(len(row) for row in self.coef)
+        if self.prime:
+            res = [[c % self.prime for c in row] + [0] * (width - len(row)) for row in self.coef]
+        else:
+            res = [list(row) + [0] * (width - len(row)) for row in self.coef]
+
+        while len(res) > 1 and not any(res[-1]):
             res.pop()
+        while width > 1 and not any(row[width - 1] for row in res):
+            width -= 1
+            for row in res:
+                row.pop()
         self.coef = res
 
     def __add__(self, other):
-        x_max_ind = max(self.x_deg, other.x_deg) + 1
-        y_max_ind = max(self.y_deg, other.y_deg) + 1
+        width = max(self.y_deg, other.y_deg) + 1
+        rows = max(self.x_deg, other.x_deg) + 1
+        zeros = [0] * width
 
-        res = [[0] * (y_max_ind) for i in range(x_max_ind)]
+        res = []
+        for i in range(rows):
+            a = self.coef[i] if i <= self.x_deg else zeros
+            b = other.coef[i] if i <= other.x_deg else zeros
+            row = [0] * width
+            row[:len(a)] = a
+            row[:len(b)] = map(add, row[:len(b)], b)
+            res.append(row)
 
-        for i in range(x_max_ind):
-            for j in range(y_max_ind):
-                if len(self.coef) > i and len(self.coef[i]) > j:
-                    res[i][j] += self.coef[i][j]
-                if len(other.coef) > i and len(other.coef[i]) > j:
-                    res[i][j] += other.coef[i][j]
-
-        return BivariatePolynomial(res)
+        return BivariatePolynomial(res, self.prime or other.prime)
 
     def __mul__(self, other):
         x_deg = self.x_deg + other.x_deg
         y_deg = self.y_deg + other.y_deg
         coefficients = [[0] * (y_deg + 1) for i in range(x_deg+1)]
+        width = other.y_deg + 1
 
-        for x1 in range(len(self.coef)):
-            for y1 in range(len(self.coef[x1])):
-                for x2 in range(len(other.coef)):
-                    for y2 in range(len(other.coef[x2])):
-                        coefficients[x1 + x2][y1 + y2] += self.coef[x1][y1] * other.coef[x2][y2]
+        for x1, row1 in enumerate(self.coef):
+            for x2, row2 in enumerate(other.coef):
+                target = coefficients[x1 + x2]
+                for y1, c in enumerate(row1):
+                    if c:
+                        target[y1:y1 + width] = map(add, target[y1:y1 + width], [c * d for d in row2])
 
-        return BivariatePolynomial(coefficients)
+        return BivariatePolynomial(coefficients, self.prime or other.prime)
 
     def cmult(self, c):
-        for i in range(len(self.coef)):
-            for j in range(len(self.coef[i])):
-                self.coef[i][j] *= c
+        for row in self.coef:
+            for j in range(len(row)):
+                row[j] *= c
+                if self.prime:
+                    row[j] %= self.prime
         return self
 
     def eval(self, x, y):
-        x_power = 1
-        total = 0
-
-        for coef in self.coef:
-            p = Polynomial(coef)
-            total += x_power * p.eval(y)
-            x_power *= x
-
-        return total
+        return self.g(x).eval(y)
 
     @staticmethod
-    def random_polynomial(secret, deg, field):
+    def random_polynomial(secret, deg, field, prime=None, rng=None):
+        """
+        Samples a bivariate polynomial of degree at most deg in each variable with the given secret at (0, 0).
+        If a prime is given the coefficients are sampled from GF(prime) and field is ignored.
+        rng is the random number generator to use (the global one by default).
+        """
+        if prime:
+            field = prime - 1
+        rng = get_rng(rng)
+
         coef = []
         for i in range(deg + 1):
             univariate_coef = []
             for j in range(deg + 1):
-                univariate_coef.append(randint(0, field))
+                univariate_coef.append(rng.randint(0, field))
             coef.append(univariate_coef)
         coef[0][0] = secret
 
-        return BivariatePolynomial(coef)
+        return BivariatePolynomial(coef, prime)
 
     def __repr__(self):
         return str(self.coef)
@@ -170,24 +516,26 @@ class BivariatePolynomial:
         return self.coef == other.coef
 
     def g(self, j):
-        coef = [0] * (self.y_deg + 1)
-        pow = 1
-
-        for c in self.coef:
-            for i in range(len(c)):
-                coef[i] += c[i] * pow
-            pow *= j
-
-        return Polynomial(coef)
+        return self.g_many([j])[0]
 
     def h(self, j):
-        coef = [0] * (self.x_deg + 1)
-
-        for i in range(len(self.coef)):
-            pow = 1
-            c = self.coef[i]
-            for k in range(len(c)):
-                coef[i] += c[k] * pow
-                pow *= j
-
-        return Polynomial(coef)
+        return self.h_many([j])[0]
+
+    def g_many(self, xs):
+        """
+        Returns the polynomials g_j(y) = f(x_j, y) for every x_j in xs.
+        The coefficient of y^k in all of them is the k-th column of the matrix evaluated at xs, so this is a single
+        evaluation table (and uses the fast path for large inputs).
+        """
+        columns = [Polynomial(column, self.prime) for column in zip(*self.coef)]
+        table = Polynomial.eval_table(columns, xs)
+        return [Polynomial(coef, self.prime) for coef in zip(*table)]
+
+    def h_many(self, xs):
+        """
+        Returns the polynomials h_j(x) = f(x, x_j) for every x_j in xs.
+        The coefficient of x^k in all of them is the k-th row of the matrix evaluated at xs.
+        """
+        rows = [Polynomial(row, self.prime) for row in self.coef]
+        table = Polynomial.eval_table(rows, xs)
+        return [Polynomial(coef, self.prime) for coef in zip(*table)]
@@ -0,0 +1,113 @@
+MAX_PROCESSOR = 2 ** 16  # The largest processor id, which bounds the size of the bitmask.
+
+
+class ProcessorSet:
+    """
+    A mutable set of processor ids (integers from 0 to MAX_PROCESSOR), stored as the bits of a single integer.
+    Adding anything else raises a ValueError, so that a bad id can't shift by a negative or huge amount.
+    It supports the usual set operations, and comparing to (or combining with) regular sets and other iterables.
+    Intersections, unions, sizes and subset tests are single integer operations, without allocating hash sets.
+    Iteration is in increasing order.
+    """
+    __slots__ = ("bits",)
+
+    def __init__(self, processors=()):
+        if isinstance(processors, ProcessorSet):
+            self.bits = processors.bits
+            return
+        bits = 0
+        for processor in processors:
+            bits |= 1 << check_processor(processor)
+        self.bits = bits
+
+    @staticmethod
+    def from_bits(bits):
+        processors = ProcessorSet()
+        processors.bits = bits
+        return processors
+
+    def add(self, processor):
+        self.bits |= 1 << check_processor(processor)
+
+    def discard(self, processor):
+        self.bits &= ~(1 << processor)
+
+    def remove(self, processor):
+        if processor not in self:
+            raise KeyError(processor)
+        self.discard(processor)
+
+    def copy(self):
+        return ProcessorSet.from_bits(self.bits)
+
+    def __contains__(self, processor):
+        return isinstance(processor, int) and processor >= 0 and self.bits >> processor & 1 == 1
+
+    def __iter__(self):
+        bits = self.bits
+        while bits:
+            lowest = bits & -bits
+            yield lowest.bit_length() - 1
+            bits ^= lowest
+
+    def __len__(self):
+        return bin(self.bits).count("1")
+
+    def __bool__(self):
+        return self.bits != 0
+
+    def intersection(self, other):
+        return ProcessorSet.from_bits(self.bits & bits_of(other))
+
+    def intersection_size(self, other):
+        """ Returns len(self.intersection(other)) without creating the intersection. """
+        return bin(self.bits & bits_of(other)).count("1")
+
+    def union(self, other):
+        return ProcessorSet.from_bits(self.bits | bits_of(other))
+
+    def difference(self, other):
+        return ProcessorSet.from_bits(self.bits & ~bits_of(other))
+
+    def issubset(self, other):
+        return self.bits & ~bits_of(other) == 0
+
+    def issuperset(self, other):
+        return bits_of(other) & ~self.bits == 0
+
+    __and__ = intersection
+    __or__ = union
+    __sub__ = difference
+    __le__ = issubset
+    __ge__ = issuperset
+
+    def __eq__(self, other):
+        if isinstance(other, (ProcessorSet, set, frozenset)):
+            return self.bits == bits_of(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "ProcessorSet(" + str(list(self)) + ")"
+
+    def __reduce__(self):
+        return ProcessorSet.from_bits, (self.bits,)
+
+
+def check_processor(processor):
+    """ Returns the processor id, or raises a ValueError if it isn't a valid one. """
+    if not isinstance(processor, int) or not 0 <= processor <= MAX_PROCESSOR:
+        raise ValueError("invalid processor id " + repr(processor))
+    return processor
+
+
+def bits_of(processors):
+    """ Returns the bitmask of a ProcessorSet or of any iterable of processor ids, which are checked like in add. """
+    if isinstance(processors, ProcessorSet):
+        return processors.bits
+    return ProcessorSet(processors).bits
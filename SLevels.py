@@ -0,0 +1,48 @@
+"""
+The dealer's G graph and S levels of an SVSS-Share invocation, maintained incrementally as edges are added.
+S_0 is every processor, and S_(i+1) is the processors j in S_i with |G_j ∩ S_i| >= n-t. Since G only grows, so do all of
+the levels, so instead of recomputing them after every edge, the size of G_j ∩ S_i is counted for every level and
+processor, and processors are promoted to the next level when their count reaches n-t.
+"""
+from ProcessorSet import ProcessorSet
+
+
+class SLevels:
+    def __init__(self, players, threshold, levels):
+        """ levels is the number of levels including S_0 (t+2 in the protocol), threshold is n-t. """
+        self.threshold = threshold
+        self.G = {j: ProcessorSet() for j in players}  # {processor: {processor1, ...}}. The symmetric G sets.
+        self.S = [ProcessorSet(players)] + [ProcessorSet() for i in range(levels - 1)]  # [S_0, S_1, ...].
+        self.counts = [{j: 0 for j in players} for i in range(levels - 1)]  # [{processor: |G_j ∩ S_i|}, ...].
+
+    def add_edge(self, a, b):
+        """ Adds a and b to each other's G sets (a to its own if a == b), and promotes processors as needed. """
+        if b in self.G[a]:
+            return
+        self.G[a].add(b)
+        self.G[b].add(a)
+
+        # (level, processor) pairs whose count has changed.
+        worklist = []
+        for i, counts in enumerate(self.counts):
+            if b in self.S[i]:
+                counts[a] += 1
+                worklist.append((i, a))
+            if a != b and a in self.S[i]:
+                counts[b] += 1
+                worklist.append((i, b))
+
+        while worklist:
+            i, j = worklist.pop()
+            if j not in self.S[i] or j in self.S[i + 1] or self.counts[i][j] < self.threshold:
+                continue
+            self.S[i + 1].add(j)
+            if i + 1 < len(self.counts):
+                for k in self.G[j]:
+                    self.counts[i + 1][k] += 1
+                    worklist.append((i + 1, k))
+                worklist.append((i + 1, j))
+
+    def done(self):
+        """ Returns True if the last level is large enough for the dealer to send G and S. """
+        return len(self.S[-1]) >= self.threshold
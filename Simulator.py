@@ -1,38 +1,319 @@
-from random import randrange
+from array import array
+from heapq import heappop, heappush
+import Trace
 from Message import Message
+from Polynomial import get_rng
+
+
+class Schedule:
+    """
+    A compact record of the random choices made by a simulator, which is enough to replay an execution exactly.
+    choices holds the index of the waiting message delivered at every step, or -1 - r if it was the r-th pending
+    delivery out of the broadcast envelopes (in the order of the envelopes, and of the recipients in each envelope).
+    releases holds the RB releases of Simulator as flattened (step, serial) pairs, where serial is the number of
+    messages sent or broadcast before the RB message.
+    batch is the number of messages the simulator was stepped by at a time (1 for step), or None before the first step.
+    Batches change the order in which the players handle messages, so a schedule can only be replayed in batches of the
+    same size.
+    """
+    def __init__(self, choices=(), releases=(), batch=None):
+        self.choices = array("q", choices)
+        self.releases = array("q", releases)
+        self.batch = batch
+
+    def save(self, path):
+        with open(path, "wb") as file:
+            array("q", [len(self.choices), len(self.releases), self.batch or 0]).tofile(file)
+            self.choices.tofile(file)
+            self.releases.tofile(file)
+
+    @staticmethod
+    def load(path):
+        schedule = Schedule()
+        with open(path, "rb") as file:
+            header = array("q")
+            header.fromfile(file, 3)
+            schedule.choices.fromfile(file, header[0])
+            schedule.releases.fromfile(file, header[1])
+            schedule.batch = header[2] or None
+        return schedule
+
+    def __eq__(self, other):
+        return self.choices == other.choices and self.releases == other.releases and self.batch == other.batch
+
+
+class Envelope:
+    """
+    A broadcast message waiting to be delivered to several players.
+    recipients is the list of players when the message was broadcast (shared by the envelopes created while the players
+    don't change). pending is a bitmap of the recipients which haven't received the message yet, by their position in
+    recipients, and count is the number of these recipients.
+    """
+    __slots__ = ("message", "recipients", "pending", "count")
+
+    def __init__(self, message, recipients):
+        self.message = message
+        self.recipients = recipients
+        self.pending = (1 << len(recipients)) - 1
+        self.count = len(recipients)
+
+
+class CountTree:
+    """
+    A Fenwick tree over the pending counts of the envelopes, by their position in the simulator's list of envelopes.
+    It finds the envelope holding the r-th pending delivery, and updates a count, in O(log(envelopes)).
+    """
+    def __init__(self):
+        self.tree = [0]  # tree[i] is the sum of the counts at positions i - (i & -i) to i - 1.
+
+    def prefix(self, i):
+        """ Returns the sum of the counts at the first i positions. """
+        total = 0
+        while i:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def append(self, count):
+        i = len(self.tree)
+        self.tree.append(count + self.prefix(i - 1) - self.prefix(i - (i & -i)))
+
+    def pop(self):
+        """ Removes the last position. No other node of the tree includes it. """
+        self.tree.pop()
+
+    def add(self, position, delta):
+        i = position + 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def find(self, r):
+        """ Returns (position, rank) such that the r-th unit of the total is the rank-th unit of position. """
+        position = 0
+        step = 1 << (len(self.tree) - 1).bit_length()
+        while step:
+            if position + step < len(self.tree) and self.tree[position + step] <= r:
+                position += step
+                r -= self.tree[position]
+            step >>= 1
+        return position, r
 
 
 class RandomOrderSimulator:
     """
     This simulator only simulates a random order.
-    It does not simulate RB's correctly, seeing as they can be sent with less than n-t participants,
-    as well as having all RB's received at the same time by all processors.
+    It does not simulate RB's correctly, seeing as they can be sent with less than n-t participants.
+    Broadcasts are kept as a single envelope each instead of a waiting entry per recipient, but every delivery is
+    still chosen uniformly among all of the pending (message, recipient) pairs.
+    If a prime is given, players created with this simulator default to doing all of their arithmetic in GF(prime).
+    rng is the random number generator (or a seed for one) used for the order. Players created with a seeded simulator
+    get their own generators seeded from it, so a seed determines the whole execution.
+    If record is True, the choices are kept in self.schedule. If replay is a recorded Schedule, its choices are used
+    instead of random ones, which reproduces the recorded execution given the same seed and players, as long as the
+    simulator is stepped in batches of the same size (see step_many).
+    If trace is a Trace.TraceWriter, every send, RB and delivery is written to it.
     """
-    def __init__(self):
+    def __init__(self, prime=None, rng=None, record=False, replay=None, trace=None):
+        self.prime = prime
+        self.rng = get_rng(rng)
         self.waiting = []
+        self.envelopes = []  # [envelope1, envelope2, ...]. Broadcasts which some players haven't received yet.
+        self.broadcasts = 0  # The number of pending deliveries in all of the envelopes.
+        self.counts = CountTree()  # The pending counts of the envelopes.
+        self.recipients = []  # [player1, player2, ...]. The players, as given to the last envelope.
         self.players = {}
         self.reconstruct_started = {}
         self.inner_time = 0
+        self.messages_sent = 0  # The number of messages sent or broadcast by the players.
+        self.replaying = replay is not None
+        self.schedule = replay if self.replaying else Schedule() if record else None
+        self.choice = 0  # The position of the next choice to replay.
+        self.trace = trace
+        self.targets = {}  # {tag: {player1, ...}}. The players which run is still waiting for, for every SVSS tag.
 
     def send(self, message, to):
-        self.waiting.append((message, to))
+        self.messages_sent += 1
+        if self.trace:
+            self.trace.write(Trace.SEND, self.inner_time, self.time(), message, to)
+        self.enqueue(message, to)
 
     def RB(self, message):
-        self.waiting.append((message, None))
+        self.messages_sent += 1
+        if self.trace:
+            self.trace.write(Trace.RB, self.inner_time, self.time(), message, None)
+        self.enqueue_broadcast(message)
+
+    def enqueue(self, message, to):
+        """ Adds a message to the messages waiting to be delivered. """
+        self.waiting.append((message, to))
+
+    def enqueue_broadcast(self, message):
+        """ Adds a message to be delivered to every player, in a single envelope. """
+        recipients = list(self.players)
+        if recipients != self.recipients:
+            self.recipients = recipients
+        self.envelopes.append(Envelope(message, self.recipients))
+        self.counts.append(len(recipients))
+        self.broadcasts += len(recipients)
+
+    def pending(self):
+        """ Returns the number of deliveries waiting. """
+        return len(self.waiting) + self.broadcasts
+
+    def next_delivery(self):
+        """ Removes and returns the next (message, recipient) pair to be delivered. """
+        return self.pop_random()
+
+    def pop_random(self):
+        """
+        Removes and returns a uniformly random waiting (message, recipient) pair, out of both the waiting messages and
+        the envelopes.
+        The chosen entry is swapped with the last one before popping, so the order of waiting carries no meaning.
+        """
+        waiting = self.waiting
+        if self.replaying:
+            index = self.schedule.choices[self.choice]
+            self.choice += 1
+        else:
+            index = self.rng.randrange(len(waiting) + self.broadcasts)
+            if index >= len(waiting):
+                index = len(waiting) - 1 - index
+            if self.schedule:
+                self.schedule.choices.append(index)
+
+        if index < 0:
+            return self.pop_broadcast(index)
+        waiting[index], waiting[-1] = waiting[-1], waiting[index]
+        return waiting.pop()
+
+    def pop_broadcast(self, index):
+        """ Removes the delivery encoded by index from its envelope, and returns it as a (message, recipient) pair. """
+        e, rank = self.counts.find(-1 - index)
+        envelopes = self.envelopes
+        envelope = envelopes[e]
+        pending = envelope.pending
+        for i in range(rank):
+            pending &= pending - 1
+        j = (pending & -pending).bit_length() - 1
+
+        envelope.pending &= ~(1 << j)
+        envelope.count -= 1
+        self.counts.add(e, -1)
+        self.broadcasts -= 1
+        if not envelope.count:
+            last = envelopes.pop()
+            if last is not envelope:
+                envelopes[e] = last
+                self.counts.add(e, last.count)
+            self.counts.pop()
+        return envelope.message, envelope.recipients[j]
 
     def step(self):
-        message, to = self.waiting.pop(randrange(len(self.waiting)))
+        self.check_batch(1)
+        message, to = self.next_delivery()
+        self.deliver(message, to)
+        self.inner_time += 1
+
+    def step_many(self, k):
+        """
+        Delivers up to k waiting messages as a single batch, and returns the number of messages delivered.
+        The messages are chosen like in step, and handed to each recipient in the order they were chosen, through
+        Player.DMM_many. A player only goes over its waiting messages after the whole batch, so messages released by an
+        earlier message of the batch are handled after the later ones, unlike when stepping one message at a time.
+        Since this changes the execution, a schedule recorded with batches of k messages can only be replayed with the
+        same k, and replaying it with another one raises a ValueError.
+        """
+        self.check_batch(k)
+        deliveries = [self.next_delivery() for i in range(min(k, self.pending()))]
+        self.deliver_many(deliveries)
+        self.inner_time += len(deliveries)
+        return len(deliveries)
+
+    def check_batch(self, k):
+        """ Records the batch size in the schedule, or checks that a replay uses the recorded one. """
+        if self.schedule is None:
+            return
+        if self.schedule.batch is None:
+            if not self.replaying:
+                self.schedule.batch = k
+        elif self.schedule.batch != k:
+            raise ValueError("the schedule was recorded in batches of {} messages, not {}".format(
+                self.schedule.batch, k))
+
+    def run_until(self, predicate, k=1):
+        """
+        Steps in batches of k messages until predicate() is True or there is nothing left to deliver.
+        Returns True iff the predicate was satisfied.
+        """
+        while not predicate():
+            if not self.remaining():
+                return False
+            self.step_many(k)
+        return True
 
+    def deliver(self, message, to):
+        """ Hands a message to its recipient, or to everybody if there is no recipient. """
+        if self.trace:
+            self.trace.write(Trace.DELIVER, self.inner_time, self.time(), message, to)
         if to:
             self.players[to].DMM(message)
         else:
             for player in self.players.values():
                 player.DMM(message)
 
-        self.inner_time += 1
+    def run(self, targets, honest=None, k=1):
+        """
+        Delivers messages until every honest player (all of them by default) has reconstructed a value for every SVSS
+        tag in targets, or there is nothing left to deliver, in batches of k messages.
+        Completion is reported by the players through SVSS_done.
+        Returns the number of deliveries which were skipped by stopping, as counted by undelivered.
+        """
+        honest = set(self.players if honest is None else honest)
+        self.targets = {}
+        for tag in targets:
+            missing = {player for player in honest if tag not in self.players[player].SVSS_val}
+            if missing:
+                self.targets[tag] = missing
+
+        while self.targets and self.remaining():
+            self.step_many(k)
+
+        self.targets = {}
+        return self.undelivered()
+
+    def SVSS_done(self, player, tag):
+        """ This function is called by a player after it has reconstructed the value of an SVSS invocation. """
+        if tag in self.targets:
+            self.targets[tag].discard(player)
+            if not self.targets[tag]:
+                self.targets.pop(tag)
+
+    def deliver_many(self, deliveries):
+        """
+        Groups a batch of (message, recipient) pairs by recipient and hands every player its messages at once.
+        Every delivery is traced with its own step, counting from the first step of the batch, and all of them with the
+        time of the batch, which is the time the players see while handling it.
+        """
+        inboxes = {}
+        for i, (message, to) in enumerate(deliveries):
+            if self.trace:
+                self.trace.write(Trace.DELIVER, self.inner_time + i, self.time(), message, to)
+            if to:
+                inboxes.setdefault(to, []).append(message)
+            else:
+                for player in self.players:
+                    inboxes.setdefault(player, []).append(message)
+
+        for to, messages in inboxes.items():
+            self.players[to].DMM_many(messages)
+
+    def undelivered(self):
+        """ Returns the number of deliveries which would still be made if the simulation continued. """
+        return self.pending()
 
     def remaining(self):
-        return len(self.waiting) > 0
+        return self.pending() > 0
 
     def time(self):
         return self.inner_time
@@ -45,42 +326,198 @@ class Simulator(RandomOrderSimulator):
     and if n-t are willing to participate with them.
     In order to be a more faithful simulation, this needs to be done t+1 times.
     If there are enough senders that are willing to work with each other, each sender receives a copy eventually.
+    The willingness of every player to process messages with a given tag is tracked incrementally.
+    A player's state can only change when it receives or sends something, so only the rows of these players are
+    recomputed before each step.
+    When replaying a schedule, the recorded releases are repeated without checking the players at all.
     """
-    def __init__(self, n, t):
-        super().__init__()
-        self.waiting_RB = []
+    def __init__(self, n, t, prime=None, rng=None, record=False, replay=None, trace=None):
+        super().__init__(prime, rng, record, replay, trace)
+        self.waiting_RB = {}  # {tag: [message1, message2, ...]}. RB messages which haven't been released yet.
+        self.new_RB = set()  # {tag1, tag2, ...}. Tags which got new RB messages since the last retry.
+        self.accepts = {}  # {tag: {player: {sender1, ...}}}. Senders of messages with the tag the player won't delay.
+        self.support = {}  # {tag: {sender: count}}. The number of players which won't delay the sender's messages.
+        self.dirty = set()  # {player1, player2, ...}. Players whose state might have changed since the last retry.
+        self.probes = {}  # {sender: message}. Empty RB messages used for asking players if they would delay a sender.
+        self.serials = {}  # {message: serial}. The number of every waiting RB message, in the order of broadcasting.
+        self.unreleased = {}  # {serial: message}. The waiting RB messages, when replaying.
+        self.release = 0  # The position of the next release to replay.
         self.n = n
         self.t = t
 
+    def send(self, message, to):
+        self.dirty.add(message.sender)
+        super().send(message, to)
+
     def RB(self, message):
-        self.waiting_RB.append(message)
+        serial = self.messages_sent
+        self.messages_sent += 1
+        if self.trace:
+            self.trace.write(Trace.RB, self.inner_time, self.time(), message, None)
+        if self.replaying:
+            self.unreleased[serial] = message
+            return
+        self.serials[message] = serial
+        self.dirty.add(message.sender)
+        if message.tag not in self.waiting_RB:
+            self.waiting_RB[message.tag] = []
+        self.waiting_RB[message.tag].append(message)
+        self.new_RB.add(message.tag)
 
     def step(self):
         self.retry_RB()
         super().step()
 
+    def step_many(self, k):
+        """ Like RandomOrderSimulator.step_many, but the RB messages are only retried once per batch. """
+        self.retry_RB()
+        return super().step_many(k)
+
+    def deliver(self, message, to):
+        self.dirty.add(to)
+        super().deliver(message, to)
+
+    def undelivered(self):
+        """ Also counts a delivery to every player for each RB message which hasn't been released yet. """
+        unreleased = len(self.unreleased) + sum(len(messages) for messages in self.waiting_RB.values())
+        return self.pending() + unreleased * len(self.players)
+
+    def deliver_many(self, deliveries):
+        self.dirty.update(to for message, to in deliveries)
+        super().deliver_many(deliveries)
+
     def retry_RB(self):
-        to_add = []
-        for message in self.waiting_RB:
-            counter = 0
-            for player in self.players.values():
-                if not player.delay_message(message, message.tag):
-                    player_message = Message(None, message.tag, player.id, None, None, True)
-                    player_counter = 0
-                    for second_player in self.players.values():
-                        if not second_player.delay_message(player_message, message.tag):
-                            player_counter += 1
-                    if player_counter >= self.n - self.t:
-                        counter += 1
-            if counter >= self.n - self.t:
-                to_add.append(message)
-        self.waiting_RB = [message for message in self.waiting_RB if message not in to_add]
-        for message in to_add:
-            for player in self.players:
-                self.waiting.append((message, player))
+        """
+        Releases every waiting RB message for which n-t players are willing to participate, such that each of them
+        has n-t players willing to participate with it.
+        Only the rows of the dirty players are recomputed, and only tags with changes are checked again.
+        """
+        if self.replaying:
+            self.replay_RB()
+            return
+
+        dirty = self.dirty
+        self.dirty = set()
+        quorum = self.n - self.t
+
+        for tag in list(self.waiting_RB):
+            if tag not in self.accepts:
+                self.accepts[tag] = {}
+                self.support[tag] = dict.fromkeys(self.players, 0)
+                changed = [self.update_accepts(tag, player) for player in self.players]
+            else:
+                changed = [self.update_accepts(tag, player) for player in dirty if player in self.players]
+
+            if not any(changed) and tag not in self.new_RB:
+                continue
+
+            accepts = self.accepts[tag]
+            support = self.support[tag]
+            participants = [accepts[player] for player in accepts if support[player] >= quorum]
+            if len(participants) < quorum:
+                continue
+
+            to_add = []
+            for message in self.waiting_RB[tag]:
+                if sum(1 for senders in participants if message.sender in senders) >= quorum:
+                    to_add.append(message)
+
+            if to_add:
+                waiting = [message for message in self.waiting_RB[tag] if message not in to_add]
+                if waiting:
+                    self.waiting_RB[tag] = waiting
+                else:
+                    self.waiting_RB.pop(tag)
+                    self.accepts.pop(tag)
+                    self.support.pop(tag)
+
+                for message in to_add:
+                    serial = self.serials.pop(message)
+                    if self.schedule:
+                        self.schedule.releases.extend((self.inner_time, serial))
+                    self.enqueue_broadcast(message)
+
+        self.new_RB = set()
+
+    def replay_RB(self):
+        """ Releases the RB messages which were released up to the current step of the recorded execution. """
+        releases = self.schedule.releases
+        while self.release < len(releases) and releases[self.release] <= self.inner_time:
+            message = self.unreleased.pop(releases[self.release + 1])
+            self.release += 2
+            self.enqueue_broadcast(message)
+
+    def update_accepts(self, tag, player_id):
+        """
+        Recomputes the senders whose messages with the tag the player wouldn't delay.
+        Returns True iff anything changed.
+        """
+        player = self.players[player_id]
+        accepted = set()
+        for sender in self.players:
+            if sender not in self.probes:
+                self.probes[sender] = Message(None, None, sender, None, None, True)
+            if not player.delay_message(self.probes[sender], tag):
+                accepted.add(sender)
+
+        previous = self.accepts[tag].get(player_id, set())
+        if accepted == previous and player_id in self.accepts[tag]:
+            return False
+
+        support = self.support[tag]
+        for sender in accepted - previous:
+            support[sender] += 1
+        for sender in previous - accepted:
+            support[sender] -= 1
+        self.accepts[tag][player_id] = accepted
+        return True
 
     def remaining(self):
         if super().remaining():
             return True
         self.retry_RB()
         return super().remaining()
+
+
+class EventSimulator(Simulator):
+    """
+    A discrete-event version of Simulator.
+    Instead of delivering a random waiting message at each step, every message gets a virtual delivery time when it is
+    sent, drawn from the latency distribution of its link, and messages are delivered in order of these times.
+    time() is the virtual time, so the invocation times recorded by the players are protocol latencies.
+    RB messages are released the same way as in Simulator, and each copy travels on the link from the original sender.
+    latency is a function returning a random delay, and links optionally maps (sender, recipient) to such a function
+    for specific links. The order is determined by the delays, so only the RB releases are recorded, and replaying
+    requires the delays to be the same, which holds for the default latency and a seeded simulator.
+    """
+    def __init__(self, n, t, latency=None, links=None, prime=None, rng=None, record=False, replay=None, trace=None):
+        super().__init__(n, t, prime, rng, record, replay, trace)
+        self.latency = latency if latency else lambda: self.rng.expovariate(1.0)
+        self.links = links if links else {}  # {(sender, recipient): latency}.
+        self.now = 0
+        self.sequence = 0  # Breaks ties between messages with the same delivery time in the order they were sent.
+
+    def enqueue(self, message, to):
+        delay = self.links.get((message.sender, to), self.latency)()
+        self.sequence += 1
+        heappush(self.waiting, (self.now + delay, self.sequence, message, to))
+
+    def enqueue_broadcast(self, message):
+        """ Every copy of a broadcast travels on its own link, so each of them is scheduled separately. """
+        for player in self.players:
+            self.enqueue(message, player)
+
+    def next_delivery(self):
+        self.now, sequence, message, to = heappop(self.waiting)
+        return message, to
+
+    def step_many(self, k):
+        """ Every message has to be delivered at its own virtual time, so the messages are delivered one by one. """
+        steps = 0
+        while steps < k and self.remaining():
+            self.step()
+            steps += 1
+        return steps
+
+    def time(self):
+        return self.now
@@ -0,0 +1,175 @@
+"""
+A fixed-width binary log of every send, RB and delivery of a simulator, for analysing long runs without re-simulating.
+Pass a TraceWriter as the trace of a simulator, close it when the run is done, and read the file back with TraceReader
+(pure python, memory mapped) or as a NumPy structured array with load_array.
+Tags are interned: the records hold tag ids, and the tags themselves are written next to the trace as a JSON array,
+with tuples as arrays and PolyTags as {"PolyTag": name}.
+"""
+import json
+import mmap
+import struct
+from collections import namedtuple
+from weakref import WeakKeyDictionary
+
+from Message import PolyTag
+from Polynomial import Polynomial
+from ProcessorSet import ProcessorSet
+
+SEND = 0
+RB = 1
+DELIVER = 2
+KINDS = {SEND: "send", RB: "RB", DELIVER: "deliver"}
+
+# time, step, message, tag, size, sender, recipient, stage, kind, 2 bytes of padding.
+RECORD = struct.Struct("<dqqiiiiBBxx")
+DTYPE = [("time", "<f8"), ("step", "<i8"), ("message", "<i8"), ("tag", "<i4"), ("size", "<i4"), ("sender", "<i4"),
+         ("recipient", "<i4"), ("stage", "u1"), ("kind", "u1"), ("padding", "V2")]
+# The number of bytes buffered before they are written to the file.
+BUFFER_SIZE = 1 << 20
+
+Record = namedtuple("Record", ["time", "step", "message", "tag", "size", "sender", "recipient", "stage", "kind"])
+
+
+def tags_path(path):
+    return path + ".tags"
+
+
+def encode_tag(tag):
+    """ Returns the tag as a JSON value. """
+    if isinstance(tag, tuple):
+        return [encode_tag(item) for item in tag]
+    if isinstance(tag, PolyTag):
+        return {"PolyTag": tag.name}
+    if isinstance(tag, int) or tag is None:
+        return tag
+    raise TypeError("can't write a tag containing " + type(tag).__name__)
+
+
+def decode_tag(value):
+    """ Returns the tag encoded by encode_tag. """
+    if isinstance(value, list):
+        return tuple(decode_tag(item) for item in value)
+    if isinstance(value, dict):
+        return PolyTag[value["PolyTag"]]
+    return value
+
+
+def payload_size(content):
+    """ Returns the number of field elements in the content of a message. """
+    if content is None:
+        return 0
+    if isinstance(content, Polynomial):
+        return len(content.coef)
+    if isinstance(content, ProcessorSet):
+        return len(content)
+    if isinstance(content, dict):
+        return sum(payload_size(key) + payload_size(value) for key, value in content.items())
+    if isinstance(content, (tuple, list, set, frozenset)):
+        return sum(payload_size(item) for item in content)
+    return 1
+
+
+class TraceWriter:
+    """
+    Writes the trace records of a simulator to path.
+    Every message gets an id the first time it is seen, so that the deliveries of a message can be matched with the
+    send or RB that created it. A delivery to everybody has recipient 0.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "wb")
+        self.buffer = bytearray()
+        self.tags = {}  # {tag: id}. The interned tags.
+        self.ids = WeakKeyDictionary()  # {message: id}. The ids of the live messages.
+        self.next_id = 0  # Ids aren't reused after messages are collected, so they're counted separately.
+        self.records = 0
+
+    def write(self, kind, step, time, message, to):
+        message_id = self.ids.get(message)
+        if message_id is None:
+            message_id = self.ids[message] = self.next_id
+            self.next_id += 1
+        tag = self.tags.get(message.tag)
+        if tag is None:
+            tag = self.tags[message.tag] = len(self.tags)
+
+        self.buffer += RECORD.pack(time, step, message_id, tag, payload_size(message.content), message.sender or 0,
+                                   to or 0, message.stage.value if message.stage else 0, kind)
+        self.records += 1
+        if len(self.buffer) >= BUFFER_SIZE:
+            self.flush()
+
+    def flush(self):
+        self.file.write(self.buffer)
+        self.buffer = bytearray()
+
+    def close(self):
+        """ Writes the remaining records and the tag table. """
+        self.flush()
+        self.file.close()
+        with open(tags_path(self.path), "w") as file:
+            json.dump([encode_tag(tag) for tag in self.tags], file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class TraceReader:
+    """ A read-only, memory mapped view of a trace as a sequence of Records. """
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if file.seek(0, 2) else b""
+        with open(tags_path(path)) as file:
+            self.tags = [decode_tag(value) for value in json.load(file)]  # The tag with every id.
+
+    def __len__(self):
+        return len(self.map) // RECORD.size
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("trace index out of range")
+        return Record(*RECORD.unpack_from(self.map, index * RECORD.size))
+
+    def __iter__(self):
+        return map(Record._make, RECORD.iter_unpack(self.map))
+
+    def close(self):
+        if self.map:
+            self.map.close()
+
+
+def load_array(path):
+    """ Returns the trace as a memory mapped NumPy structured array with the fields of DTYPE. Requires NumPy. """
+    import numpy
+    return numpy.memmap(path, dtype=numpy.dtype(DTYPE), mode="r")
+
+
+def message_counts(records):
+    """ Returns {(kind, stage): count} for the records. """
+    counts = {}
+    for record in records:
+        key = (record.kind, record.stage)
+        counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+def delivery_latencies(records, clock="step"):
+    """
+    Returns {stage: [latency1, ...]}, the time between the send or RB of every message and each of its deliveries,
+    measured in steps or, with clock="time", in the simulator's time.
+    """
+    sent = {}
+    latencies = {}
+    for record in records:
+        now = record.step if clock == "step" else record.time
+        if record.kind == DELIVER:
+            if record.message in sent:
+                latencies.setdefault(record.stage, []).append(now - sent[record.message])
+        else:
+            sent[record.message] = now
+    return latencies
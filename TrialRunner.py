@@ -0,0 +1,184 @@
+"""
+Runs many independent SVSS executions in a process pool and aggregates the results as they arrive.
+Every trial builds its own simulator and players and is seeded separately, so trials can run on any worker in any
+order, and a single trial can be re-run on its own with run_trial.
+The schedules of failed trials can be recorded, and replayed later with replay_trial without any random choices.
+Run from the command line with `python TrialRunner.py trials n t [--processes P] [--prime P] [--seed S]`,
+add `--record DIR` to save the schedules of failed trials, and replay one with `--replay FILE --seed S`.
+"""
+import os
+import random
+import sys
+from argparse import ArgumentParser
+from functools import partial
+from multiprocessing import Pool
+from time import perf_counter
+
+from Player import Player
+from Simulator import Schedule, Simulator
+
+
+def run_trial(config, record=False, replay=None, early=False):
+    """
+    Runs a single SVSS-Share and SVSS-Reconstruct with a random dealer and secret.
+    config is a tuple (seed, n, t, prime, simulator_class, player_classes), where player_classes maps player ids to
+    Player subclasses to use instead of Player (for example, faulty players). Classes must be importable by the workers.
+    If record is True, the schedule of a failed trial is included in the result. replay is a recorded Schedule to
+    follow instead of making random choices. If early is True, the trial stops as soon as every honest player has
+    reconstructed a value, and the result counts the deliveries which were skipped.
+    Returns a dictionary describing the execution.
+    """
+    seed, n, t, prime, simulator_class, player_classes = config
+
+    sim = simulator_class(n, t, prime=prime, rng=random.Random(seed), record=record, replay=replay)
+    players = {i: player_classes.get(i, Player)(sim, i, n, t) for i in range(1, n + 1)}
+    sim.players = players
+
+    dealer = players[sim.rng.randint(1, n)]
+    secret = sim.rng.randint(0, prime - 1 if prime else n ** 2)
+    tag = (1, dealer.id)
+    dealer.deal_SVSS(secret)
+
+    honest = [player for player in players.values() if player.id not in player_classes]
+    skipped = 0
+    if early:
+        skipped = sim.run([tag], [player.id for player in honest])
+    else:
+        while sim.remaining():
+            sim.step()
+
+    values = {player.id: player.SVSS_val.get(tag) for player in players.values()}
+    success = all(values[player.id] == secret for player in honest)
+
+    return {
+        "seed": seed,
+        "dealer": dealer.id,
+        "secret": secret,
+        "success": success,
+        "values": values,
+        "steps": sim.inner_time,
+        "messages": sim.messages_sent,
+        "skipped": skipped,
+        "D": {player.id: set(player.D) for player in players.values()},
+        "schedule": sim.schedule if record and not success else None,
+    }
+
+
+def replay_trial(schedule, seed, n, t, prime=None, simulator_class=Simulator, player_classes=None, early=False):
+    """ Re-runs the trial with the given seed following a recorded schedule, and returns its result. """
+    return run_trial((seed, n, t, prime, simulator_class, player_classes or {}), replay=schedule, early=early)
+
+
+class TrialStatistics:
+    """ Aggregates trial results incrementally, without keeping the results themselves. """
+    def __init__(self):
+        self.trials = 0
+        self.successes = 0
+        self.steps = 0
+        self.min_steps = None
+        self.max_steps = None
+        self.messages = 0
+        self.skipped = 0  # The number of deliveries skipped by stopping early.
+        self.detected = {}  # {processor: count}. The number of trials in which some player added the processor to D.
+        self.failed_seeds = []  # Seeds of trials in which an honest player didn't reconstruct the secret.
+        self.failed_schedules = {}  # {seed: schedule}. The recorded schedules of the failed trials.
+
+    def add(self, result):
+        self.trials += 1
+        if result["success"]:
+            self.successes += 1
+        else:
+            self.failed_seeds.append(result["seed"])
+            if result.get("schedule"):
+                self.failed_schedules[result["seed"]] = result["schedule"]
+
+        steps = result["steps"]
+        self.steps += steps
+        self.min_steps = steps if self.min_steps is None else min(self.min_steps, steps)
+        self.max_steps = steps if self.max_steps is None else max(self.max_steps, steps)
+        self.messages += result["messages"]
+        self.skipped += result["skipped"]
+
+        for processor in set().union(*result["D"].values()):
+            self.detected[processor] = self.detected.get(processor, 0) + 1
+
+    def __str__(self):
+        if not self.trials:
+            return "no trials"
+        return "\n".join([
+            "trials: " + str(self.trials),
+            "successes: " + str(self.successes) + " ({:.1%})".format(self.successes / self.trials),
+            "steps: mean {:.1f}, min {}, max {}".format(self.steps / self.trials, self.min_steps, self.max_steps),
+            "messages: mean {:.1f}".format(self.messages / self.trials),
+            "skipped deliveries: mean {:.1f}".format(self.skipped / self.trials),
+            "added to D: " + str(self.detected),
+            "failed seeds: " + str(self.failed_seeds),
+        ])
+
+
+def iterate_trials(trials, n, t, prime=None, processes=None, seed=0, simulator_class=Simulator,
+                   player_classes=None, record=False, early=False):
+    """
+    Runs the trials with seeds seed, seed+1, ... on a pool of processes (all cores by default), and yields each result
+    as soon as it is done. The results come in completion order, not in seed order.
+    If record is True, failed trials come with their schedules. If early is True, trials stop as soon as every
+    honest player has reconstructed a value.
+    """
+    configs = ((seed + i, n, t, prime, simulator_class, player_classes or {}) for i in range(trials))
+    trial = partial(run_trial, record=record, early=early)
+
+    if processes == 1:
+        for config in configs:
+            yield trial(config)
+        return
+
+    with Pool(processes) as pool:
+        for result in pool.imap_unordered(trial, configs):
+            yield result
+
+
+def run_trials(trials, n, t, prime=None, processes=None, seed=0, simulator_class=Simulator, player_classes=None,
+               callback=None, record=False, early=False):
+    """ Runs the trials like iterate_trials and returns their TrialStatistics. callback is called on every result. """
+    statistics = TrialStatistics()
+    for result in iterate_trials(trials, n, t, prime, processes, seed, simulator_class, player_classes, record,
+                                 early):
+        statistics.add(result)
+        if callback:
+            callback(result)
+    return statistics
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Run independent SVSS executions in parallel.")
+    parser.add_argument("trials", type=int)
+    parser.add_argument("n", type=int)
+    parser.add_argument("t", type=int)
+    parser.add_argument("--processes", type=int, default=None, help="number of worker processes (default: all cores)")
+    parser.add_argument("--prime", type=int, default=None, help="do all of the arithmetic in GF(prime)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first trial")
+    parser.add_argument("--record", default=None, help="save the schedules of failed trials in this directory")
+    parser.add_argument("--replay", default=None, help="replay the trial with the given seed from this schedule")
+    parser.add_argument("--early", action="store_true",
+                        help="stop every trial once the honest players have reconstructed a value")
+    args = parser.parse_args()
+
+    if args.replay:
+        result = replay_trial(Schedule.load(args.replay), args.seed, args.n, args.t, args.prime, early=args.early)
+        result.pop("schedule")
+        print(result)
+        sys.exit()
+
+    start = perf_counter()
+    statistics = run_trials(args.trials, args.n, args.t, args.prime, args.processes, args.seed,
+                            callback=lambda result: print(".", end="", flush=True, file=sys.stderr),
+                            record=args.record is not None, early=args.early)
+    elapsed = perf_counter() - start
+
+    print(file=sys.stderr)
+    print(statistics)
+    print("trials per second: {:.2f}".format(statistics.trials / elapsed))
+
+    for seed, schedule in statistics.failed_schedules.items():
+        os.makedirs(args.record, exist_ok=True)
+        schedule.save(os.path.join(args.record, "schedule-" + str(seed) + ".bin"))
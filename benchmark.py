@@ -0,0 +1,229 @@
+"""
+Microbenchmarks for the polynomial arithmetic and the simulators.
+Run all of them with `python benchmark.py`, or only some of them with `python benchmark.py interpolation ...`.
+"""
+import sys
+from random import randint, randrange
+from timeit import Timer
+
+import NTT
+from Message import PolyTag
+from Player import Player
+from Polynomial import *
+from ProcessorSet import ProcessorSet
+from Simulator import RandomOrderSimulator, Simulator
+
+# A Mersenne prime, large enough that the benchmarks never have to worry about collisions.
+BENCH_PRIME = 2 ** 31 - 1
+
+
+def measure(func, min_time=0.2):
+    """ Returns the average number of seconds a single call to func takes. """
+    timer = Timer(func)
+    number, total = timer.autorange()
+    while total < min_time:
+        number *= 2
+        total = timer.timeit(number)
+    return total / number
+
+
+def random_points(k, prime=BENCH_PRIME):
+    poly = Polynomial.random_polynomial(randint(0, prime - 1), k - 1, None, prime)
+    return [(x, poly.eval(x)) for x in range(1, k + 1)]
+
+
+def bench_interpolation(sizes=(4, 8, 16, 32, 64, 128, 256)):
+    """ Compares the O(k^3) Lagrange interpolation with the O(k^2) barycentric interpolation. """
+    print("interpolation in GF(" + str(BENCH_PRIME) + ")")
+    print("{:>6} {:>17} {:>17} {:>9}".format("k", "lagrange (ms)", "barycentric (ms)", "speedup"))
+    for k in sizes:
+        points = random_points(k)
+        assert Polynomial.interpolate_lagrange(points, BENCH_PRIME) == \
+            Polynomial.interpolate_barycentric(points, BENCH_PRIME)
+
+        lagrange = measure(lambda: Polynomial.interpolate_lagrange(points, BENCH_PRIME))
+        barycentric = measure(lambda: Polynomial.interpolate_barycentric(points, BENCH_PRIME))
+        print("{:>6} {:>17.3f} {:>17.3f} {:>9.1f}".format(k, lagrange * 1000, barycentric * 1000,
+                                                          lagrange / barycentric))
+
+
+def bench_evaluation(sizes=(16, 64, 256)):
+    """ Compares evaluating n polynomials of degree n/3 at n points one by one and as a single table. """
+    print("evaluation table of n polynomials of degree n/3 at n points in GF(" + str(BENCH_PRIME) + ")")
+    print("{:>6} {:>17} {:>17} {:>9}".format("n", "horner (ms)", "table (ms)", "speedup"))
+    for n in sizes:
+        polys = [Polynomial.random_polynomial(0, n // 3, None, BENCH_PRIME) for i in range(n)]
+        xs = range(1, n + 1)
+        assert Polynomial.eval_table(polys, xs) == [[p.eval(x) for x in xs] for p in polys]
+
+        horner = measure(lambda: [[p.eval(x) for x in xs] for p in polys])
+        table = measure(lambda: Polynomial.eval_table(polys, xs))
+        print("{:>6} {:>17.3f} {:>17.3f} {:>9.1f}".format(n, horner * 1000, table * 1000, horner / table))
+
+
+def crossover(sizes, naive, fast):
+    """ Returns the smallest size from which the fast function is always faster than the naive one, or None. """
+    found = None
+    for size in sizes:
+        if fast(size) < naive(size):
+            if found is None:
+                found = size
+        else:
+            found = None
+    return found
+
+
+def bench_crossover(sizes=(16, 32, 64, 128, 256, 512, 1024, 2048)):
+    """
+    Measures the quadratic and the subproduct tree interpolations over NTT_PRIME, and prints the size from which the
+    fast one wins, to compare with Polynomial.FAST_INTERPOLATE_THRESHOLD.
+    """
+    prime = NTT.NTT_PRIME
+    threshold = Polynomial.FAST_INTERPOLATE_THRESHOLD
+    times = {}
+
+    def timed(size, fast):
+        points = random_points(size, prime)
+        Polynomial.FAST_INTERPOLATE_THRESHOLD = 0 if fast else float("inf")
+        Polynomial.interpolate(points, prime)
+        times[(size, fast)] = measure(lambda: Polynomial.interpolate(points, prime), 0.1)
+        return times[(size, fast)]
+
+    try:
+        found = crossover(sizes, lambda k: timed(k, False), lambda k: timed(k, True))
+    finally:
+        Polynomial.FAST_INTERPOLATE_THRESHOLD = threshold
+
+    print("naive vs subproduct tree interpolation over GF(" + str(prime) + ")")
+    print("{:>6} {:>17} {:>17}".format("n", "naive (ms)", "fast (ms)"))
+    for size in sizes:
+        print("{:>6} {:>17.3f} {:>17.3f}".format(size, times[(size, False)] * 1000, times[(size, True)] * 1000))
+    print("crossover:", found, "(threshold " + str(threshold) + ")")
+
+
+def reconstruction_state(n, t, prime=BENCH_PRIME):
+    """
+    Returns a player which has finished all of the MW-Reconstruct invocations of an honest SVSS invocation,
+    together with the SVSS tag and the secret.
+    """
+    player = Player(None, 1, n, t, prime)
+    secret = randint(0, prime - 1)
+    poly = BivariatePolynomial.random_polynomial(secret, t, None, prime)
+    tag = (1, 1)
+    players = list(player.players)
+
+    player.S[tag] = ProcessorSet(players)
+    player.G[tag] = {k: ProcessorSet(players) for k in players}
+    player.MW_val[tag] = {PolyTag.G: {}, PolyTag.H: {}}
+    for k, g, h in zip(players, poly.g_many(players), poly.h_many(players)):
+        player.MW_val[tag][PolyTag.G][k] = dict(zip(players, g.eval_many(players)))
+        player.MW_val[tag][PolyTag.H][k] = dict(zip(players, h.eval_many(players)))
+
+    return player, tag, secret
+
+
+def bench_reconstruction(sizes=(4, 7, 16, 31, 64, 127, 256)):
+    """
+    Measures interpolate_SVSS_val for growing n, with t = (n-1)/3.
+    The g/h cross check is also timed on its own, both with scalar evaluations and with evaluation tables.
+    """
+    print("SVSS reconstruction in GF(" + str(BENCH_PRIME) + ")")
+    print("{:>6} {:>17} {:>17} {:>17}".format("n", "reconstruct (ms)", "scalar check (ms)", "table check (ms)"))
+    for n in sizes:
+        t = (n - 1) // 3
+        player, tag, secret = reconstruction_state(n, t)
+
+        def reconstruct():
+            player.SVSS_val.pop(tag, None)
+            player.interpolate_SVSS_val(tag)
+
+        reconstruct()
+        assert player.SVSS_val[tag] == secret
+
+        players = list(player.players)
+        g_polys = [Polynomial.interpolate(list(player.MW_val[tag][PolyTag.G][k].items()), BENCH_PRIME)
+                   for k in players]
+        h_polys = [Polynomial.interpolate(list(player.MW_val[tag][PolyTag.H][k].items()), BENCH_PRIME)
+                   for k in players]
+
+        def scalar_check():
+            return all(g_polys[i - 1].eval(j) == h_polys[j - 1].eval(i) for i in players for j in players)
+
+        def table_check():
+            g_table = Polynomial.eval_table(g_polys, players)
+            h_table = Polynomial.eval_table(h_polys, players)
+            return all(tuple(row) == column for row, column in zip(g_table, zip(*h_table)))
+
+        assert scalar_check() and table_check()
+        print("{:>6} {:>17.3f} {:>17.3f} {:>17.3f}".format(n, measure(reconstruct) * 1000,
+                                                         measure(scalar_check) * 1000, measure(table_check) * 1000))
+
+
+class EchoPlayer:
+    """ A player which sends every message it receives back to itself, so that the queue length stays constant. """
+    def __init__(self, simulator, id):
+        self.simulator = simulator
+        self.id = id
+
+    def DMM(self, message):
+        self.simulator.send(message, self.id)
+
+
+class ListPopSimulator(RandomOrderSimulator):
+    """ The simulator with the old O(queue length) removal from the middle of the list. """
+    def pop_random(self):
+        return self.waiting.pop(randrange(len(self.waiting)))
+
+
+def bench_queue(sizes=(10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6), steps=20000):
+    """ Measures simulator steps per second with list.pop(i) and with swap-with-last removal as the queue grows. """
+    print("simulator steps per second with a queue of constant length")
+    print("{:>9} {:>17} {:>17} {:>9}".format("queue", "list pop", "swap pop", "speedup"))
+    for size in sizes:
+        rates = []
+        for simulator_class in [ListPopSimulator, RandomOrderSimulator]:
+            sim = simulator_class()
+            sim.players = {1: EchoPlayer(sim, 1)}
+            sim.waiting = [(None, 1)] * size
+
+            def run():
+                for i in range(steps):
+                    sim.step()
+
+            rates.append(steps / measure(run, 0.5))
+        print("{:>9} {:>17.0f} {:>17.0f} {:>9.1f}".format(size, rates[0], rates[1], rates[1] / rates[0]))
+
+
+def bench_batch(n=4, t=1, batches=(1, 8, 64, 512)):
+    """ Measures a whole SVSS execution with Simulator, delivering the messages in batches of growing size. """
+    print("SVSS with Simulator(" + str(n) + ", " + str(t) + ") in GF(" + str(BENCH_PRIME) + ") by batch size")
+    print("{:>6} {:>17} {:>17}".format("batch", "run (ms)", "steps per second"))
+    for batch in batches:
+        steps = []
+
+        def run():
+            sim = Simulator(n, t, BENCH_PRIME, rng=0)
+            sim.players = {i: Player(sim, i, n, t) for i in range(1, n + 1)}
+            sim.players[1].deal_SVSS(1)
+            sim.run_until(lambda: False, batch)
+            steps.append(sim.inner_time)
+
+        seconds = measure(run, 1)
+        print("{:>6} {:>17.1f} {:>17.0f}".format(batch, seconds * 1000, steps[-1] / seconds))
+
+
+BENCHMARKS = {
+    "interpolation": bench_interpolation,
+    "evaluation": bench_evaluation,
+    "crossover": bench_crossover,
+    "reconstruction": bench_reconstruction,
+    "queue": bench_queue,
+    "batch": bench_batch,
+}
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
+        print()
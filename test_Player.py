@@ -1,9 +1,19 @@
 from Player import Player
 from Message import *
 from Polynomial import *
-from random import randrange
+from MWProgress import MWProgress
+from ProcessorSet import ProcessorSet
+from SLevels import SLevels
+import NTT
+import gc
+from random import Random, randrange
 from Simulator import RandomOrderSimulator
 from Simulator import Simulator as RBRandomOrderSimulator
+from Simulator import EventSimulator, Schedule
+from TrialRunner import replay_trial, run_trial, run_trials
+import Network
+import Trace
+from Trace import TraceReader, TraceWriter, delivery_latencies, message_counts
 
 
 class FakeSimulator:
@@ -70,6 +80,18 @@ class MWEvilRandomOrderSimulator(MWRandomOrderSimulator):
             self.RB(self.dropped)
 
 
+class CountingSimulator(RBRandomOrderSimulator):
+    """ Counts the OK messages broadcast for every MW-Share tag. """
+    def __init__(self, n, t, rng=None):
+        super().__init__(n, t, rng=rng)
+        self.oks = {}  # {tag: count}.
+
+    def RB(self, message):
+        if message.stage == Stage.MW_OK:
+            self.oks[message.tag] = self.oks.get(message.tag, 0) + 1
+        super().RB(message)
+
+
 class EvilPlayer(Player):
     def __init__(self, simulator, id, n, t):
         super().__init__(simulator, id, n, t)
@@ -88,14 +110,23 @@ def test_polynomials():
     # Check minimize
     assert Polynomial([1, 2, 0]) == Polynomial([1, 2])
     assert Polynomial([1, 2, 0]).deg == Polynomial([1, 2]).deg
-    assert Polynomial([0]).coef == [0]
+    assert Polynomial([0]).coef == (0,)
 
     # Check basic operations
     assert f + g == Polynomial([1, 1, 4])
     assert f * g == Polynomial([0, -1, -1, -1, 3])
     assert f.eval(2) == 17
-    f.cmult(2)
-    assert f == Polynomial([2, 4, 6])
+    assert f.cmult(2) == Polynomial([2, 4, 6])
+    assert f == Polynomial([1, 2, 3]), "cmult changed the polynomial"
+
+    # Check immutability and hashing
+    try:
+        f.coef = (0,)
+        assert False, "Polynomial isn't immutable"
+    except AttributeError:
+        pass
+    assert hash(Polynomial([1, 2, 0])) == hash(Polynomial([1, 2]))
+    assert len({f, Polynomial([1, 2, 3]), g}) == 2
 
     # Check interpolation
     p = Polynomial.interpolate([(1, 5), (2, 11), (3, 19), (4, 29)])
@@ -141,6 +172,155 @@ def test_random_polynomials():
         assert bp.h(j) == Polynomial.interpolate([(i, bp.eval(i,j)) for i in range(deg + 1)])
 
 
+def test_prime_field_polynomials():
+    prime = 10007
+
+    f = Polynomial([1, 2, 3], prime)
+    g = Polynomial([0, -1, 1], prime)
+
+    assert g == Polynomial([0, prime - 1, 1]), "Coefficients not reduced"
+    assert f + g == Polynomial([1, 1, 4])
+    assert f * g == Polynomial([0, prime - 1, prime - 1, prime - 1, 3])
+    assert f.eval(prime + 2) == 17
+
+    for i in range(10):
+        secret = randint(0, prime - 1)
+        p = Polynomial.random_polynomial(secret, 30, None, prime)
+        assert p.eval(0) == secret, "Univariate polynomial with wrong secret"
+        assert all(0 <= c < prime for c in p.coef), "Coefficient outside of the field"
+        assert Polynomial.interpolate([(x, p.eval(x)) for x in range(1, 32)], prime) == p, "Wrong interpolation"
+
+        bp = BivariatePolynomial.random_polynomial(secret, 4, None, prime)
+        assert bp.eval(0, 0) == secret, "Bivariate polynomial with wrong secret"
+        j = randint(1, 4)
+        assert bp.g(j) == Polynomial.interpolate([(i, bp.eval(j, i)) for i in range(1, 6)], prime)
+        assert bp.h(j) == Polynomial.interpolate([(i, bp.eval(i, j)) for i in range(1, 6)], prime)
+
+
+def test_player_prime():
+    def trial_division(p):
+        return p >= 2 and all(p % i for i in range(2, int(p ** 0.5) + 1))
+
+    assert all(is_prime(p) == trial_division(p) for p in range(5000)), "Wrong primality test"
+    assert is_prime(NTT.NTT_PRIME) and is_prime(2 ** 61 - 1) and not is_prime(2 ** 61 + 1), "Wrong primality test"
+
+    for prime in [3, 5, 10, 561]:
+        try:
+            Player(None, 1, 5, 1, prime)
+        except ValueError:
+            pass
+        else:
+            assert False, "Accepted a field too small for the players, or not a field"
+    assert Player(None, 1, 5, 1, 7).prime == 7, "Rejected a valid prime"
+
+
+def test_interpolate_at_zero():
+    prime = 10007
+    for i in range(10):
+        p = Polynomial.random_polynomial(randint(0, 40), 4, 16)
+        points = [(x, p.eval(x)) for x in range(1, 6)]
+        assert Polynomial.interpolate_at_zero(points) == p.eval(0), "Wrong value at 0"
+        assert Polynomial.interpolate_at_zero(points[::-1]) == p.eval(0), "Order of the points matters"
+
+        p = Polynomial.random_polynomial(randint(0, prime - 1), 4, None, prime)
+        points = [(x, p.eval(x)) for x in range(1, 6)]
+        assert Polynomial.interpolate_at_zero(points, prime) == p.eval(0), "Wrong value at 0"
+
+    assert lagrange_weights.cache_info().hits > 0, "Weights weren't cached"
+
+
+def test_interpolate_barycentric():
+    prime = 10007
+    for k in range(1, 12):
+        points = [(x, randint(-40, 40)) for x in range(-k, 2 * k, 3)]
+        assert Polynomial.interpolate_barycentric(points, prime) == Polynomial.interpolate_lagrange(points, prime)
+
+        p = Polynomial.random_polynomial(randint(0, 40), k - 1, 16)
+        assert Polynomial.interpolate_barycentric([(x, p.eval(x)) for x in range(k)]) == p
+
+
+def test_eval_table():
+    prime = 10007
+    for field in [None, prime]:
+        polys = [Polynomial.random_polynomial(randint(0, 40), deg, 40, field) for deg in range(5)]
+        xs = range(-3, 8)
+        table = Polynomial.eval_table(polys, xs)
+        assert table == [[p.eval(x) for x in xs] for p in polys], "Wrong evaluation table"
+        assert polys[2].eval_many(xs) == table[2], "Wrong evaluation"
+
+
+def test_evaluation_table():
+    p = Polynomial([1, 2, 3], 10007)
+    assert not p.evaluation_table(), "Table not empty"
+    assert p.eval_cached(2) == p.eval(2)
+    assert p.evaluation_table() == {2: 17}, "Value not stored"
+
+    p.tabulate(range(5))
+    assert p.evaluation_table() == {x: p.eval(x) for x in range(5)}, "Table not filled"
+    assert p == Polynomial([1, 2, 3]) and hash(p) == hash(Polynomial([1, 2, 3])), "Table changed the polynomial"
+
+    polys = [Polynomial([i, 1]) for i in range(3)]
+    Polynomial.eval_table(polys, [4, 5], store=True)
+    assert all(q.evaluation_table() == {4: q.eval(4), 5: q.eval(5)} for q in polys), "Table not filled"
+
+    p = Polynomial([1, 2, 3], 10007)
+    p.tabulate(range(2 * Polynomial.EVAL_CACHE_SIZE))
+    assert p.eval_cached(-1) == p.eval(-1), "Wrong value after the table is full"
+    assert len(p.evaluation_table()) == Polynomial.EVAL_CACHE_SIZE, "Table not bounded"
+
+
+def test_bivariate_g_h_many():
+    prime = 10007
+    for field in [None, prime]:
+        bp = BivariatePolynomial.random_polynomial(randint(0, 40), 4, 40, field)
+        xs = range(1, 8)
+        assert bp.g_many(xs) == [bp.g(j) for j in xs], "Wrong g polynomials"
+        assert bp.h_many(xs) == [bp.h(j) for j in xs], "Wrong h polynomials"
+        for j, g, h in zip(xs, bp.g_many(xs), bp.h_many(xs)):
+            assert all(g.eval(i) == bp.eval(j, i) for i in xs), "g doesn't agree with the polynomial"
+            assert all(h.eval(i) == bp.eval(i, j) for i in xs), "h doesn't agree with the polynomial"
+
+
+def test_fast_path():
+    prime = NTT.NTT_PRIME
+    interpolate_threshold = Polynomial.FAST_INTERPOLATE_THRESHOLD
+    polys = [Polynomial.random_polynomial(randint(0, 40), deg, None, prime) for deg in [0, 10, 100, 250]]
+    xs = range(-50, 150)
+    points = [(x, randint(0, prime - 1)) for x in range(1, 120)]
+
+    naive_table = Polynomial.eval_table(polys, xs)
+    naive_poly = Polynomial.interpolate(points, prime)
+    assert [NTT.multipoint_evaluate(p.coef, xs) for p in polys] == naive_table, "Wrong fast evaluation"
+    try:
+        Polynomial.FAST_INTERPOLATE_THRESHOLD = 0
+        assert Polynomial.interpolate(points, prime) == naive_poly, "Wrong fast interpolation"
+    finally:
+        Polynomial.FAST_INTERPOLATE_THRESHOLD = interpolate_threshold
+
+
+def test_degree_bound():
+    prime = 10007
+    for i in range(10):
+        for field in [None, prime]:
+            p = Polynomial.random_polynomial(randint(0, 40), 3, 40, field)
+            points = [(x, p.eval(x)) for x in range(1, 11)]
+            assert Polynomial.bounded_value_at_zero(points, 3, field) == (True, p.eval(0)), "Consistent points rejected"
+            assert Polynomial.interpolate_bounded(points, 3, field) == p, "Wrong interpolation"
+
+            x, y = points.pop(randint(0, 9))
+            points.append((x, y + 1))
+            assert Polynomial.bounded_value_at_zero(points, 3, field) == (False, None), "Inconsistent points accepted"
+            assert Polynomial.interpolate_bounded(points, 3, field) is None, "Inconsistent points interpolated"
+
+
+def test_pop_random():
+    sim = RandomOrderSimulator()
+    sim.waiting = list(range(100))
+    popped = [sim.pop_random() for i in range(100)]
+    assert sorted(popped) == list(range(100)), "Not every message was removed exactly once"
+    assert not sim.remaining(), "Messages left over"
+
+
 def test_mw_deal():
     sim = FakeSimulator()
     p = Player(sim, 1, 4, 1)
@@ -527,6 +707,32 @@ def test_MW_dealer_OK():
         assert False, "No OK sent"
 
 
+def test_MW_dealer_single_OK():
+    sim = FakeSimulator()
+    players = {i: Player(sim, i, 4, 1) for i in range(1, 4 + 1)}
+    dealer = players[1]
+    mod = players[2]
+
+    dealer.deal_MW(1, 1, 1, 2, PolyTag.G)
+    mod.MW_moderate(1, 1, 1, 1, PolyTag.G)
+
+    for stage in [Stage.MW_VALUES, Stage.MW_CORROBORATE, Stage.MW_ACK, Stage.MW_L, Stage.MW_M]:
+        for message, to in list(sim.messages):
+            if message.stage == stage:
+                players[to].DMM(message)
+        for RB in list(sim.RB_list):
+            if RB.stage == stage:
+                for i in players:
+                    players[i].DMM(RB)
+
+    # Acks and L sets which arrive again after the OK was sent don't send it again.
+    for RB in list(sim.RB_list):
+        if RB.stage in (Stage.MW_ACK, Stage.MW_L):
+            dealer.DMM(RB)
+
+    assert len([RB for RB in sim.RB_list if RB.stage == Stage.MW_OK]) == 1, "Not exactly one OK sent"
+
+
 def test_MW_finish():
     sim = FakeSimulator()
     players = {i:Player(sim, i, 4, 1) for i in range(1, 4+1)}
@@ -893,6 +1099,56 @@ def test_SVSS_correct_RB():
         assert player.SVSS_val[(1, dealer.id)] == secret, "Wrong secret reconstructed"
 
 
+def test_SVSS_prime_field():
+    n = 7
+    t = 2
+    prime = next_prime(10 ** 9)
+    sim = RBRandomOrderSimulator(n, t, prime)
+    players = {i: Player(sim, i, n, t) for i in range(1, n + 1)}
+    sim.players = players
+
+    dealer = players[randint(1, n)]
+    secret = randint(0, prime - 1)
+
+    dealer.deal_SVSS(secret)
+
+    while sim.remaining():
+        sim.step()
+
+    for player in players.values():
+        assert player.prime == prime, "Didn't take the field from the simulator"
+        assert (1, dealer.id) in player.SVSS_val, "No secret reconstructed"
+        assert player.SVSS_val[(1, dealer.id)] == secret, "Wrong secret reconstructed"
+
+
+def test_SVSS_event_simulator():
+    n = 4
+    t = 1
+    slow = 1000
+    # Every message from player 1 to player 2 takes much longer than all of the others.
+    sim = EventSimulator(n, t, latency=lambda: randint(1, 10), links={(1, 2): lambda: slow})
+    players = {i: Player(sim, i, n, t) for i in range(1, n + 1)}
+    sim.players = players
+
+    dealer = players[randint(1, n)]
+    secret = randint(1, 40)
+
+    dealer.deal_SVSS(secret)
+
+    last = 0
+    while sim.remaining():
+        sim.step()
+        assert sim.time() >= last, "Time went backwards"
+        last = sim.time()
+
+    tag = (1, dealer.id)
+    for player in players.values():
+        assert player.SVSS_val[tag] == secret, "Wrong secret reconstructed"
+        assert all(end is None or end > begin for begin, end in player.invocations.values()), "Wrong invocation times"
+
+    assert sim.time() >= slow, "Slow link ignored"
+
+
 def test_SVSS_evil_player():
     n = 4
     t = 1
@@ -982,22 +1238,22 @@ def test_delay_message():
         player.invocations[tag] = times[i]
         assert player.delay_message(message, tag) == values[i]
 
-    player.DEAL[second_tag] = {2: 1}
+    player.add_entry(player.DEAL, second_tag, 2, 1)
 
     for i in range(len(times)):
         player.invocations[tag] = times[i]
         assert player.delay_message(message, tag) == values[i]
 
-    player.ACK[second_tag] = {(1,2): 1}
+    player.add_entry(player.ACK, second_tag, (1,2), 1)
     for i in range(len(times)):
         player.invocations[tag] = times[i]
         assert player.delay_message(message, tag) == values[i]
 
-    player.DEAL.pop(second_tag)
+    player.remove_entries(player.DEAL, second_tag)
     for i in range(len(times)):
         player.invocations[tag] = times[i]
         assert player.delay_message(message, tag) == values[i]
-    player.ACK.pop(second_tag)
+    player.remove_entries(player.ACK, second_tag)
 
     player.invocations[second_tag] = [10, 20]
 
@@ -1008,19 +1264,470 @@ def test_delay_message():
     values[5] = True
     values[8] = True
 
-    player.DEAL[second_tag] = {2: 1}
+    player.add_entry(player.DEAL, second_tag, 2, 1)
 
     for i in range(len(times)):
         player.invocations[tag] = times[i]
         assert player.delay_message(message, tag) == values[i]
 
-    player.ACK[second_tag] = {(1,2): 1}
+    player.add_entry(player.ACK, second_tag, (1,2), 1)
     for i in range(len(times)):
         player.invocations[tag] = times[i]
         assert player.delay_message(message, tag) == values[i]
 
-    player.DEAL.pop(second_tag)
+    player.remove_entries(player.DEAL, second_tag)
     for i in range(len(times)):
         player.invocations[tag] = times[i]
         assert player.delay_message(message, tag) == values[i]
-    player.ACK.pop(second_tag)
+    player.remove_entries(player.ACK, second_tag)
+
+
+def test_trial_runner():
+    statistics = run_trials(4, 4, 1, processes=2, seed=10)
+    assert statistics.trials == 4, "Wrong number of trials"
+    assert statistics.successes == 4, "Honest trial failed"
+    assert statistics.min_steps > 0 and statistics.messages > 0, "Didn't count steps and messages"
+
+    config = (3, 4, 1, None, RBRandomOrderSimulator, {4: EvilPlayer})
+    result = run_trial(config)
+    assert result == run_trial(config), "Trial not reproducible from its seed"
+    assert result["success"] or any(4 in D for D in result["D"].values()), "Wrong secret, but didn't update D"
+
+
+def test_schedule_replay(tmp_path):
+    n = 4
+    t = 1
+
+    def run(**kwargs):
+        sim = RBRandomOrderSimulator(n, t, rng=5, **kwargs)
+        sim.players = {i: Player(sim, i, n, t) for i in range(1, n + 1)}
+        sim.players[1].deal_SVSS(7)
+        while sim.remaining():
+            sim.step()
+        return sim, {player.id: player.SVSS_val.get((1, 1)) for player in sim.players.values()}
+
+    recorded, values = run(record=True)
+    assert values == dict.fromkeys(range(1, n + 1), 7), "Wrong secret reconstructed"
+    assert len(recorded.schedule.choices) == recorded.inner_time, "Not every choice was recorded"
+    assert recorded.schedule.releases, "No RB releases were recorded"
+    assert run()[0].inner_time == recorded.inner_time, "Seeded run isn't reproducible"
+
+    path = str(tmp_path / "schedule.bin")
+    recorded.schedule.save(path)
+    schedule = Schedule.load(path)
+    assert schedule == recorded.schedule, "Schedule changed when saved"
+
+    replayed, replayed_values = run(replay=schedule)
+    assert replayed_values == values and replayed.inner_time == recorded.inner_time, "Replay diverged"
+    assert replayed.choice == len(schedule.choices) and not replayed.unreleased, "Replay didn't follow the schedule"
+
+    def run_batches(k, **kwargs):
+        sim = RBRandomOrderSimulator(n, t, rng=5, **kwargs)
+        sim.players = {i: Player(sim, i, n, t) for i in range(1, n + 1)}
+        sim.players[1].deal_SVSS(7)
+        sim.run_until(lambda: False, k)
+        return sim
+
+    recorded = run_batches(4, record=True)
+    assert recorded.schedule.batch == 4, "Batch size not recorded"
+    recorded.schedule.save(path)
+    schedule = Schedule.load(path)
+    assert schedule == recorded.schedule, "Schedule changed when saved"
+    assert run_batches(4, replay=schedule).inner_time == recorded.inner_time, "Batched replay diverged"
+    try:
+        run_batches(1, replay=schedule)
+    except ValueError:
+        pass
+    else:
+        assert False, "Replayed a schedule with another batch size"
+
+    config = (3, n, t, None, RBRandomOrderSimulator, {4: EvilPlayer})
+    result = run_trial(config, record=True)
+    if not result["success"]:
+        assert replay_trial(result["schedule"], 3, n, t, None, RBRandomOrderSimulator, {4: EvilPlayer})["values"] \
+            == result["values"], "Failed trial didn't replay"
+
+
+def test_trace(tmp_path):
+    n = 4
+    t = 1
+    path = str(tmp_path / "trace.bin")
+    with TraceWriter(path) as trace:
+        sim = EventSimulator(n, t, rng=2, trace=trace)
+        sim.players = {i: Player(sim, i, n, t) for i in range(1, n + 1)}
+        sim.players[1].deal_SVSS(7)
+        while sim.remaining():
+            sim.step()
+
+    reader = TraceReader(path)
+    assert len(reader) == trace.records, "Wrong number of records"
+    assert reader[-1] == list(reader)[-1], "Indexing and iterating disagree"
+
+    counts = message_counts(reader)
+    sent = sum(count for (kind, stage), count in counts.items() if kind != Trace.DELIVER)
+    delivered = sum(count for (kind, stage), count in counts.items() if kind == Trace.DELIVER)
+    assert sent == sim.messages_sent and delivered == sim.inner_time, "Wrong message counts"
+    assert reader[0].kind == Trace.SEND and reader[0].stage == Stage.SVSS_VALUES.value, "Wrong first record"
+    assert reader.tags[reader[0].tag] == (1, 1), "Wrong tag"
+    assert all(tag in reader.tags for tag in sim.players[1].invocations), "Tags not written"
+
+    latencies = delivery_latencies(reader, "time")
+    assert sum(len(values) for values in latencies.values()) == delivered, "Deliveries not matched with their sends"
+    assert all(latency >= 0 for values in latencies.values() for latency in values), "Negative latency"
+    reader.close()
+
+
+def test_trace_ids(tmp_path):
+    path = str(tmp_path / "trace.bin")
+    live = [Message(i, (1, i), 1, Stage.MW_ACK) for i in range(3)]
+    with TraceWriter(path) as trace:
+        for step, message in enumerate(live):
+            trace.write(Trace.SEND, step, float(step), message, 2)
+        for i in range(10):
+            trace.write(Trace.SEND, 3, 3.0, Message(i, (2, i), 1, Stage.MW_ACK), 2)
+        gc.collect()
+        for step, message in enumerate(live, 10):
+            trace.write(Trace.SEND, step, 2.0 * step, Message(None, (3, step), 1, Stage.MW_ACK), 2)
+            trace.write(Trace.DELIVER, step, 2.0 * step, message, 2)
+
+    reader = TraceReader(path)
+    ids = [record.message for record in reader if record.kind == Trace.SEND]
+    assert len(set(ids)) == len(ids), "Reused the id of a message"
+    assert delivery_latencies(reader, "time") == {Stage.MW_ACK.value: [20.0, 21.0, 22.0]}, "Wrong latencies"
+    assert delivery_latencies(reader) == {Stage.MW_ACK.value: [10, 10, 10]}, "Wrong latencies in steps"
+    reader.close()
+
+
+def test_codec():
+    poly = Polynomial([1, 2, 3], 13)
+    content = ([{1, 2}, set()], {1: {2, 3}}, (poly, -5, 2 ** 70, 0.5, Fraction(1, 3), None, True, frozenset([4])),
+               ProcessorSet([0, 3, 70]))
+    message = Message(content, (1, 2, 3, 4, PolyTag.H), 3, Stage.MW_L, 4, True)
+    decoded = Network.decode(Network.encode(message))
+    assert (decoded.content, decoded.tag, decoded.sender, decoded.stage, decoded.moderator, decoded.RB) == \
+        (content, message.tag, 3, Stage.MW_L, 4, True), "Message changed by the codec"
+    assert decoded.content[2][0].prime == 13, "Lost the field of the polynomial"
+    assert isinstance(decoded.content[3], ProcessorSet), "Processor set decoded as a different type"
+
+
+def test_processor_set():
+    rng = Random(3)
+    for i in range(200):
+        a = {rng.randrange(20) for i in range(rng.randrange(10))}
+        b = {rng.randrange(20) for i in range(rng.randrange(10))}
+        pa = ProcessorSet(a)
+        pb = ProcessorSet(b)
+        assert list(pa) == sorted(a) and len(pa) == len(a) and bool(pa) == bool(a), "Wrong elements"
+        assert pa == a and (pa != b) == (a != b) and (pa == pb) == (a == b), "Wrong comparison"
+        assert pa & pb == a & b and pa.intersection_size(b) == len(a & b), "Wrong intersection"
+        assert pa | pb == a | b and pa - pb == a - b, "Wrong union or difference"
+        assert pa.issubset(pb) == a.issubset(b) and pa.issuperset(b) == a.issuperset(b), "Wrong subset test"
+        copy = pa.copy()
+        copy.add(25)
+        copy.discard(min(a, default=0))
+        assert pa == a and 25 in copy and min(a, default=0) not in copy, "Copy shares its elements"
+    assert None not in ProcessorSet([1]) and -1 not in ProcessorSet([1]), "Invalid processor contained"
+
+    for processor in [-1, "a", 1.5, 2 ** 70]:
+        builds = [lambda: ProcessorSet([processor]), lambda: ProcessorSet().add(processor), lambda: pa | [processor]]
+        for build in builds:
+            try:
+                build()
+            except ValueError:
+                pass
+            else:
+                assert False, "Accepted an invalid processor"
+
+    player = Player(None, 1, 4, 1)
+    players = [1, 2, 3, 4]
+    for S, G in [([players, players, [-1]], {j: players for j in players}), ([players] * 3, {"a": players}),
+                 ([players] * 3, {j: players + [2 ** 70] for j in players}), ([players] * 3, {1: players})]:
+        player.receive_SVSS_G(Message((S, G), (1, 2), 2, Stage.SVSS_G, RB=True))
+        assert (1, 2) not in player.G, "Accepted G and S with invalid processors"
+
+
+def test_s_levels():
+    rng = Random(5)
+    for n, t in [(4, 1), (7, 2), (10, 3)]:
+        players = range(1, n + 1)
+        levels = SLevels(players, n - t, t + 2)
+        G = {j: set() for j in players}
+        for i in range(3 * n * n):
+            a = rng.choice(players)
+            b = rng.choice(players)
+            levels.add_edge(a, b)
+            G[a].add(b)
+            G[b].add(a)
+
+            S = [set(players)] + [set() for i in range(t + 1)]
+            for i in range(t + 1):
+                S[i + 1] = {j for j in S[i] if len(G[j] & S[i]) >= n - t}
+            assert levels.G == G and levels.S == S, "S levels differ from recomputing them"
+            assert levels.done() == (len(S[-1]) >= n - t), "Wrong completion"
+        assert levels.done(), "Complete graph not done"
+
+
+
+def test_mw_progress():
+    rng = Random(6)
+    n = 7
+    for trial in range(100):
+        progress = MWProgress()
+        M = None
+        L = {}
+        acks = set()
+        for i in range(40):
+            kind = rng.randrange(6)
+            if kind == 0:
+                M = ProcessorSet(rng.randrange(1, n + 1) for i in range(4))
+                progress.set_M(M, L)
+            elif kind in (1, 2):
+                j = rng.randrange(1, n + 1)
+                old = L.get(j)
+                L[j] = ProcessorSet(rng.randrange(1, n + 1) for i in range(4))
+                progress.set_L(j, old, L[j], acks, M)
+            else:
+                j = rng.randrange(1, n + 1)
+                if j not in acks:
+                    acks.add(j)
+                    progress.ack(j, M)
+
+            done = M is not None and all(j in L and L[j] <= acks for j in M)
+            assert progress.done() == done, "Wrong MW-Share completion"
+
+
+def test_network():
+    results = Network.measure(4, 1, prime=next_prime(10 ** 6), seed=1, timeout=120)
+    assert results[0]["success"], "Wrong secret reconstructed over the network"
+    assert results[0]["frames"] > 0 and results[0]["latency"] > 0, "Nothing measured"
+
+
+def test_network_senders():
+    node = Network.Node(1, 4, 1)
+    node.handle(2, Network.RB_INIT, (1, Message(None, (1, 3), 3, Stage.MW_L, RB=True)))
+    assert not node.rb_messages, "Accepted an RB message in the name of another node"
+    node.handle(2, Network.RB_INIT, (1, Message(None, (1, 3), 2, Stage.MW_L, RB=True)))
+    assert list(node.rb_messages) == [(2, 1)], "Didn't accept an RB message from its sender"
+    digest = node.rb_messages[(2, 1)][1]
+    for i in range(3):
+        node.handle(3, Network.RB_ECHO, (2, 1, digest))
+    assert node.rb_echoes[(2, 1)][digest] == {3}, "Counted echoes in the name of other nodes"
+
+
+class BrokenPlayer(Player):
+    def DMM(self, message):
+        raise ArithmeticError("broken player")
+
+
+def test_network_failure():
+    try:
+        Network.measure(4, 1, prime=next_prime(10 ** 6), seed=1, player_classes={2: BrokenPlayer}, timeout=120)
+    except ArithmeticError:
+        pass
+    else:
+        assert False, "The exception of the player wasn't raised"
+
+
+def test_step_many(tmp_path):
+    n = 4
+    t = 1
+    for sim in [RBRandomOrderSimulator(n, t, rng=1), RandomOrderSimulator(rng=1), EventSimulator(n, t, rng=1)]:
+        sim.players = {i: Player(sim, i, n, t) for i in range(1, n + 1)}
+        sim.players[2].deal_SVSS(5)
+        assert sim.step_many(0) == 0, "Delivered messages in an empty batch"
+        assert sim.run_until(lambda: all((1, 2) in player.SVSS_val for player in sim.players.values()), 32), \
+            "Stopped before reconstructing"
+        assert all(player.SVSS_val[(1, 2)] == 5 for player in sim.players.values()), "Wrong secret reconstructed"
+        assert not sim.run_until(lambda: False, 32) and not sim.remaining(), "Didn't deliver everything"
+
+    path = str(tmp_path / "trace.bin")
+    with TraceWriter(path) as trace:
+        sim = RandomOrderSimulator(rng=1, trace=trace)
+        sim.players = {i: Player(sim, i, n, t) for i in range(1, n + 1)}
+        sim.players[2].deal_SVSS(5)
+        sim.run_until(lambda: False, 8)
+    steps = [record.step for record in TraceReader(path) if record.kind == Trace.DELIVER]
+    assert steps == list(range(sim.inner_time)), "Deliveries of a batch not traced at their own steps"
+
+
+def test_envelopes():
+    sim = RandomOrderSimulator(rng=4, record=True)
+    sim.players = dict.fromkeys(range(1, 6))
+    sim.enqueue("a", 1)
+    sim.enqueue_broadcast("b")
+    sim.enqueue_broadcast("c")
+    sim.enqueue("d", 2)
+    assert len(sim.envelopes) == 2 and sim.pending() == 12, "Broadcasts not kept in envelopes"
+
+    popped = [sim.pop_random() for i in range(12)]
+    expected = [("a", 1), ("d", 2)] + [(message, to) for message in "bc" for to in range(1, 6)]
+    assert sorted(popped) == sorted(expected), "Wrong deliveries"
+    assert not sim.remaining() and not sim.envelopes, "Deliveries left over"
+
+    replay = RandomOrderSimulator(replay=sim.schedule)
+    replay.players = sim.players
+    replay.enqueue("a", 1)
+    replay.enqueue_broadcast("b")
+    replay.enqueue_broadcast("c")
+    replay.enqueue("d", 2)
+    assert [replay.pop_random() for i in range(12)] == popped, "Replay diverged"
+
+    sim = RandomOrderSimulator(rng=5)
+    sim.players = dict.fromkeys(range(1, 6))
+    for message in range(30):
+        sim.enqueue_broadcast(message)
+        if message == 10:
+            sim.players = dict.fromkeys(range(6, 9))
+    counts = {}
+    for i in range(100):
+        message, to = sim.pop_random()
+        counts[message] = counts.get(message, 0) + 1
+        assert (to in range(1, 6)) == (message <= 10), "Delivered to players added or removed later"
+    assert len(counts) > 25, "Deliveries not spread over the envelopes"
+    while sim.remaining():
+        message, to = sim.pop_random()
+        counts[message] = counts.get(message, 0) + 1
+    assert counts == {message: 5 if message <= 10 else 3 for message in range(30)}, "Wrong deliveries"
+
+
+def test_early_termination():
+    n = 4
+    t = 1
+    sim = RBRandomOrderSimulator(n, t, rng=8)
+    sim.players = {i: Player(sim, i, n, t) for i in range(1, n + 1)}
+    sim.players[3].deal_SVSS(9)
+    skipped = sim.run([(1, 3)], k=4)
+    assert all(player.SVSS_val[(1, 3)] == 9 for player in sim.players.values()), "Stopped before reconstructing"
+    unreleased = sum(len(messages) for messages in sim.waiting_RB.values())
+    assert skipped == sim.pending() + n * unreleased and skipped > 0, "Wrong number of skipped deliveries"
+    assert not sim.targets and sim.run([(1, 3)]) == skipped, "Ran again although everything is reconstructed"
+    delivered = 0
+    while sim.remaining():
+        sim.step()
+        delivered += 1
+    assert delivered >= skipped, "Counted deliveries which never happened"
+
+    player = Player(FakeSimulator(), 1, n, t)
+    player.set_SVSS_value(9, (1, 3))
+    assert player.SVSS_val[(1, 3)] == 9, "Value not set without SVSS_done"
+
+    config = (5, n, t, None, RBRandomOrderSimulator, {})
+    full = run_trial(config)
+    early = run_trial(config, early=True)
+    assert early["success"] and early["steps"] < full["steps"] and early["skipped"] > 0, "Didn't stop early"
+
+
+def scan_delay(player, sender, tag):
+    # The definition of delay_message, scanning all of ACK and DEAL.
+    for check_against, key in [(player.ACK, lambda entry: entry[1]), (player.DEAL, lambda entry: entry)]:
+        for check_tag in check_against:
+            end = player.invocations[check_tag][1]
+            if end is not None and any(key(entry) == sender for entry in check_against[check_tag]) and \
+                    (end if tag not in player.invocations else end < player.invocations[tag][0]):
+                return True
+    return False
+
+
+def test_delay_index():
+    player = Player(None, 1, 4, 1)
+    rng = Random(6)
+    tags = [(i, 1, 1, 1, PolyTag.G) for i in range(6)]
+    for tag in tags:
+        player.invocations[tag] = [rng.randint(1, 10), None]
+
+    for i in range(2000):
+        tag = rng.choice(tags)
+        sender = rng.randint(1, 4)
+        action = rng.randrange(7)
+        if action == 0:
+            player.invocations[tag][1] = player.invocations[tag][0] + rng.randint(0, 10)
+            player.delays.ended(tag)
+        elif action == 1:
+            player.invocations[tag] = [rng.randint(1, 10), None]
+            player.delays.ended(tag)
+        elif action == 2:
+            player.add_entry(player.ACK, tag, (rng.randint(1, 4), sender), 0)
+        elif action == 3:
+            player.add_entry(player.DEAL, tag, sender, 0)
+            player.add_entry(player.DEAL, tag, rng.randint(1, 4), 0)
+        elif action == 4 and tag in player.ACK:
+            player.remove_entry(player.ACK, tag, next(iter(player.ACK[tag])))
+        elif action == 5 and tag in player.DEAL and sender in player.DEAL[tag]:
+            player.remove_entry(player.DEAL, tag, sender)
+        elif action == 6:
+            player.remove_entries(rng.choice([player.ACK, player.DEAL]), tag)
+
+        message = Message(None, tag, sender, Stage.MW_VALUES)
+        assert player.delay_message(message, tag) == scan_delay(player, sender, tag), \
+            "Index disagrees with ACK and DEAL"
+
+    player = Player(None, 1, 4, 1)
+    player.invocations[tags[0]] = [1, 2]
+    player.invocations[tags[1]] = [3, None]
+    player.add_entry(player.DEAL, tags[0], 2, 0)
+    message = Message(None, tags[1], 2, Stage.MW_VALUES)
+    player.receive_or_delay(message)
+    assert player.waiting == {(2, tags[0]): [message]}, "Message not delayed by DEAL"
+    player.remove_entries(player.DEAL, tags[0])
+    assert not player.waiting and player.woken == [message], "Message not woken after removing its DEAL entry"
+
+    # An invocation which hasn't begun isn't delayed by invocations which ended at time 0, only by later ones.
+    player = Player(None, 1, 4, 1)
+    player.invocations[tags[0]] = [0, 0]
+    player.add_entry(player.DEAL, tags[0], 2, 0)
+    assert player.blocking_tag(message, tags[2]) is None, "Delayed by an invocation which ended at time 0"
+    player.invocations[tags[1]] = [0, 4]
+    player.add_entry(player.DEAL, tags[1], 2, 0)
+    assert player.blocking_tag(message, tags[2]) == tags[1], "Not delayed by an invocation which ended later"
+
+
+def check_incremental_state(sim):
+    """
+    Compares the state the players keep incrementally (the dealers' S levels, the MW-Share progress and the delay
+    index) to recomputing it from their sets.
+    """
+    n = sim.n
+    t = sim.t
+    for player in sim.players.values():
+        for tag, levels in player.S_dealer.items():
+            G = player.G_dealer[tag]
+            S = [set(sim.players)] + [set() for i in range(t + 1)]
+            for i in range(t + 1):
+                S[i + 1] = {j for j in S[i] if len(G[j].intersection(S[i])) >= n - t}
+            assert levels.S == S, "Dealer's S levels differ from recomputing them"
+            assert (tag in player.G_sent) == (len(S[-1]) >= n - t), "G sent at the wrong time"
+
+        for tag in player.MW_M:
+            done = all(j in player.MW_L[tag] and player.MW_L[tag][j] <= player.MW_ack[tag] for j in player.MW_M[tag])
+            assert player.MW_progress[tag].done() == done, "Wrong MW-Share completion"
+            assert (tag in player.MW_share_done) == (done and tag in player.MW_OK), "Wrong MW_share_done"
+            if player.id == tag[2]:
+                assert sim.oks.get(tag, 0) == (tag in player.MW_OK_sent), "Wrong number of OK messages"
+
+        for sender in sim.players:
+            for tag in player.invocations:
+                message = Message(None, tag, sender, Stage.MW_VALUES)
+                assert player.delay_message(message, tag) == scan_delay(player, sender, tag), \
+                    "Index disagrees with ACK and DEAL"
+        for (sender, tag), messages in player.waiting.items():
+            assert scan_delay(player, sender, messages[0].tag), "Message delayed for no reason"
+
+
+def test_incremental_state():
+    # Rescanning is slow, so the state is only checked every few steps, and less often for larger n.
+    for n, t, seed, every in [(4, 1, 3, 5), (7, 2, 5, 500)]:
+        sim = CountingSimulator(n, t, rng=seed)
+        sim.players = {i: Player(sim, i, n, t) for i in range(1, n + 1)}
+        dealer = 1 + seed % n
+        sim.players[dealer].deal_SVSS(seed)
+        while sim.remaining():
+            sim.step()
+            if sim.inner_time % every == 0:
+                check_incremental_state(sim)
+
+        tag = (1, dealer)
+        S = sim.players[dealer].S_dealer[tag].S[-1]
+        assert all(player.S[tag] == S for player in sim.players.values()), "Players didn't accept S"
+        assert all(player.SVSS_val[tag] == seed and not player.waiting for player in sim.players.values()), \
+            "Wrong SVSS outcome"
+        assert len(sim.oks) == 2 * n * n and set(sim.oks.values()) == {1}, "Wrong number of OK messages"